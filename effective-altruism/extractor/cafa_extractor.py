@@ -1,32 +1,66 @@
 import csv
 import itertools
 import json
-import re
 from string import Template
 
-import urllib3
-from bs4 import BeautifulSoup, Tag, NavigableString
+from charity import Charity, charities_as_dicts
+from charity_store import CharityStore
+from compressed_output import open_output, write_json_records
+from detail_page_crawler import DetailPageCrawler
+from freshness_store import PAGE_MAX_AGE_SECONDS, FreshnessStore
+from parse_cache import ParseCache
+from request_scheduler import RequestScheduler
+from task_queue import TaskQueue
+from text_cleaning import remove_line_breaks, remove_non_alphanumeric
 
 CAFA_API_URL = \
     'https://cafa.iphiview.com/cafa/API/EnhancedCharitySearch/' \
     'dagenhancedcharitysearchbyfocusandgeographicarea'
 
+CAFA_SOURCE = 'cafa'
+
 CAFA_JSON_DUMP_PATH = '../data/cafa.json'
 CAFA_CSV_DUMP_PATH = '../data/cafa.csv'
+CAFA_FRESHNESS_PATH = '../data/cafa_freshness.json'
+CAFA_PARSE_CACHE_PATH = '../data/cafa_parse_cache.json'
 
 
 class CafaExtractor:
-    http = urllib3.PoolManager()
-
+    http = RequestScheduler()
+    freshness_store = FreshnessStore(CAFA_FRESHNESS_PATH)
+    parse_cache = ParseCache(CAFA_PARSE_CACHE_PATH)
+    charity_store = CharityStore()
+    output_compression = None
+    json_dump_path = CAFA_JSON_DUMP_PATH
+    csv_dump_path = CAFA_CSV_DUMP_PATH
+    task_queue = TaskQueue(CAFA_SOURCE)
+    detail_workers = 1
+    detail_page_max_age_seconds = PAGE_MAX_AGE_SECONDS
+
+    # the paginated search is cheap next to the detail pages, so the fingerprint covers
+    # every listed charity rather than a sample of them
     def do_scrape(self):
         charities = self.get_charities()
-        charities_with_details = self.get_charities_detailed(charities)
 
-        charities_column_names_standardized = self.convert_to_standardized_columns(
-            charities_with_details)
+        source_fingerprint = self.freshness_store.generate_fingerprint(charities)
+        if self.freshness_store.is_unchanged(source_fingerprint,
+                                             [self.json_dump_path, self.csv_dump_path]):
+            print('Source unchanged, reusing ' + self.json_dump_path)
+            return
+
+        detail_page_crawler = self.create_detail_page_crawler()
+        charities_with_details = detail_page_crawler.crawl(charities)
 
-        self.write_list_as_json_to_file(CAFA_JSON_DUMP_PATH, charities_column_names_standardized)
-        self.write_list_as_csv_to_file(CAFA_CSV_DUMP_PATH, charities_column_names_standardized)
+        charities_standardized = self.convert_to_standardized_columns(charities_with_details)
+        charities_column_names_standardized = charities_as_dicts(charities_standardized)
+
+        self.write_list_as_json_to_file(self.json_dump_path, charities_column_names_standardized)
+        self.write_list_as_csv_to_file(self.csv_dump_path, charities_column_names_standardized)
+
+        self.charity_store.write_charities(CAFA_SOURCE, charities_standardized)
+        self.parse_cache.save()
+        detail_page_crawler.save_freshness(source_fingerprint)
+        self.task_queue.clear_done()
 
     def get_number_of_charities(self):
         query_parameters = self.generate_default_query_parameters()
@@ -51,20 +85,16 @@ class CafaExtractor:
         request_json = json.loads(request.data)
         return request_json['Data']
 
-    def get_charities_detailed(self, charities):
-        return [{**charity, **self.get_charity_detailed_page(charity)}
-                for charity in charities]
-
-    def get_charity_detailed_page(self, charity):
-        details_dispatch = charity['DetailsDispatch']
-        charity_detailed_page_url = self.generate_charity_details_url(details_dispatch)
-
-        request = self.http.request('GET', charity_detailed_page_url)
-        request_html_body = request.data.decode("UTF-8")
-
-        return self.get_charity_details_from_page_html(request_html_body)
+    def create_detail_page_crawler(self):
+        return DetailPageCrawler(
+            self.http, self.freshness_store, self.parse_cache, self.task_queue,
+            lambda charity: self.generate_charity_details_url(charity['DetailsDispatch']),
+            self.get_charity_details_from_page_html, self.detail_workers,
+            self.detail_page_max_age_seconds)
 
     def get_charity_details_from_page_html(self, request_html_body):
+        from bs4 import BeautifulSoup
+
         soup = BeautifulSoup(request_html_body, 'html.parser')
 
         charity_details = {
@@ -85,33 +115,26 @@ class CafaExtractor:
 
     @staticmethod
     def convert_to_standardized_columns(charities):
-        columns_to_keep = ["name", "website", "cause_area", "description",
-                           "address", "email", "contact_number"]
-
-        for charity in charities:
-            charity['name'] = charity.get('Name', '')
-            charity['website'] = charity.get('Organization Url', '')
-            charity['cause_area'] = charity.get('FieldsOfInterest', '')
-            charity['description'] \
-                = charity.get('Organization Mission', ' ') \
-                  + charity.get('Organization Summary', ' ') \
-                  + charity.get('Organization Background', ' ') \
-                  + charity.get('How will a grant make a difference', ' ')
-            charity['address'] = charity.get('Organization FullAddress', '')
-            charity['email'] = charity.get('Email', ' ') + charity.get('Work EMail', ' ') \
-                               + charity.get('email', ' ')
-            charity['contact_number'] \
-                = charity.get('Direct Phone', ' ') + charity.get('Direct Fax', ' ') \
-                  + charity.get('Office Fax', ' ') + charity.get('Cell Phone', ' ') \
-                  + charity.get('Office General', ' ') + charity.get('Work Phone', ' ') \
-                  + charity.get('Work Fax', ' ') + charity.get('Employers Phone', ' ') \
-                  + charity.get('Home Fax', ' ')
-
-            for column_name in list(charity.keys()):
-                if column_name not in columns_to_keep:
-                    del charity[column_name]
-
-        return charities
+        return [
+            Charity(
+                source_key=charity.get('DetailsDispatch', ''),
+                name=charity.get('Name', ''),
+                website=charity.get('Organization Url', ''),
+                cause_area=charity.get('FieldsOfInterest', ''),
+                description=charity.get('Organization Mission', ' ')
+                            + charity.get('Organization Summary', ' ')
+                            + charity.get('Organization Background', ' ')
+                            + charity.get('How will a grant make a difference', ' '),
+                address=charity.get('Organization FullAddress', ''),
+                email=charity.get('Email', ' ') + charity.get('Work EMail', ' ')
+                      + charity.get('email', ' '),
+                contact_number=charity.get('Direct Phone', ' ') + charity.get('Direct Fax', ' ')
+                               + charity.get('Office Fax', ' ') + charity.get('Cell Phone', ' ')
+                               + charity.get('Office General', ' ')
+                               + charity.get('Work Phone', ' ') + charity.get('Work Fax', ' ')
+                               + charity.get('Employers Phone', ' ')
+                               + charity.get('Home Fax', ' '))
+            for charity in charities]
 
     @staticmethod
     def get_charity_communications(soup):
@@ -123,7 +146,7 @@ class CafaExtractor:
         communications_trs = communications_div.find_all("tr")
         for tr in communications_trs:
             communication_field = tr.contents[0].text
-            communication_field = re.sub("[^a-zA-Z0-9 ]", "", communication_field)
+            communication_field = remove_non_alphanumeric(communication_field)
 
             communication_field_detail = tr.contents[1].text
 
@@ -141,9 +164,9 @@ class CafaExtractor:
         text_details = {}
         for dt in dt_elements:
             dt_title = dt.text
-            dt_title = re.sub("[^a-zA-Z0-9 ]", "", dt_title)
+            dt_title = remove_non_alphanumeric(dt_title)
             dt_contents = self.get_text_from_element(dt.nextSibling)
-            dt_contents = re.sub("[\n\r]", "", dt_contents)
+            dt_contents = remove_line_breaks(dt_contents)
 
             text_details[dt_title] = dt_contents
 
@@ -151,6 +174,8 @@ class CafaExtractor:
 
     @staticmethod
     def get_text_from_element(element):
+        from bs4 import NavigableString, Tag
+
         if isinstance(element, Tag):
             return element.text
         elif isinstance(element, NavigableString):
@@ -192,13 +217,12 @@ class CafaExtractor:
         keys_flattened = list(itertools.chain.from_iterable(keys_unflattened))
         return set(keys_flattened)
 
-    @staticmethod
-    def write_list_as_json_to_file(filepath, list_of_dicts):
-        with open(filepath, 'w') as file_out:
-            json.dump(list_of_dicts, file_out)
+    def write_list_as_json_to_file(self, filepath, list_of_dicts):
+        with open_output(filepath, self.output_compression) as file_out:
+            write_json_records(file_out, list_of_dicts)
 
     def write_list_as_csv_to_file(self, filepath, list_of_dicts):
-        with open(filepath, mode='w', newline="\n") as csv_file:
+        with open_output(filepath, self.output_compression, newline="\n") as csv_file:
             fieldnames = self.get_all_possible_fieldnames(list_of_dicts)
             csv_file_writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
 
@@ -0,0 +1,135 @@
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+from request_scheduler import RequestScheduler
+
+CHARITIES_GOV_SG_DETAILS_BASE_URL = \
+    'https://www.charities.gov.sg/_layouts/MCYSCPSearch/MCYSCPSearchCriteriaPage.aspx'
+CHARITIES_GOV_SG_DETAILS_CACHE_PATH = '../data/charitiesgovsg_details'
+CHARITIES_GOV_SG_DETAILS_MAX_WORKERS = 8
+# income and expenditure are updated every financial year without the details url changing
+CHARITIES_GOV_SG_DETAILS_MAX_AGE_SECONDS = 30 * 24 * 60 * 60
+
+DETAIL_LABELS = {
+    'objectives': ['Objectives', 'Objective', 'Charitable Objects', 'Charitable Objectives'],
+    'total_income': ['Total Income', 'Total Receipts'],
+    'total_expenditure': ['Total Expenditure'],
+    'financial_year_end': ['Financial Year End', 'Financial Period'],
+    'contact_person': ['Contact Person', 'Name of Contact Person'],
+    'email': ['Email', 'E-mail', 'Email Address'],
+    'contact_number': ['Telephone', 'Telephone No', 'Tel', 'Contact Number'],
+}
+
+LABEL_ELEMENT_NAMES = ['td', 'th', 'dt', 'label', 'span', 'strong', 'b']
+VALUE_ELEMENT_NAMES = ['td', 'dd', 'span', 'div', 'p']
+
+WHITESPACE_RUN_PATTERN = re.compile(r"\s+")
+UNSAFE_FILENAME_CHARACTER_PATTERN = re.compile("[^a-zA-Z0-9]")
+
+
+class CharitiesGovSgDetailCrawler:
+    http = RequestScheduler()
+
+    def __init__(self, cache_path=CHARITIES_GOV_SG_DETAILS_CACHE_PATH,
+                 max_workers=CHARITIES_GOV_SG_DETAILS_MAX_WORKERS,
+                 max_age_seconds=CHARITIES_GOV_SG_DETAILS_MAX_AGE_SECONDS):
+        self.cache_path = cache_path
+        self.max_workers = max_workers
+        self.max_age_seconds = max_age_seconds
+        self.uncrawled_count = 0
+        self.column_by_label = {label.lower(): column
+                                for column, labels in DETAIL_LABELS.items()
+                                for label in labels}
+
+    def enrich(self, charities):
+        os.makedirs(self.cache_path, exist_ok=True)
+
+        charities_to_crawl = [charity for charity in charities
+                              if self.get_cached_details(charity) is None]
+        print('Detail pages to crawl: ' + str(len(charities_to_crawl))
+              + ' of ' + str(len(charities)))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            crawled = list(executor.map(self.try_crawl_charity_details, charities_to_crawl))
+        self.uncrawled_count = crawled.count(False)
+        if self.uncrawled_count:
+            print('Warning: Detail pages not crawled: ' + str(self.uncrawled_count))
+
+        return [{**charity, **(self.get_cached_details(charity) or {})}
+                for charity in charities]
+
+    # a UEN is crawled again when its details url changes or its details grow old
+    def get_cached_details(self, charity):
+        cache_filepath = self.generate_cache_filepath(charity['UEN No'])
+        if not os.path.exists(cache_filepath):
+            return None
+
+        with open(cache_filepath) as file_in:
+            cached_page = json.load(file_in)
+
+        if cached_page['details_url'] != charity['Details URL']:
+            return None
+        if time.time() - cached_page.get('fetched_at', 0) >= self.max_age_seconds:
+            return None
+
+        return cached_page['details']
+
+    # a page that cannot be fetched leaves its UEN uncached, so the next run tries it again,
+    # and does not stop the other UENs from being crawled
+    def try_crawl_charity_details(self, charity):
+        try:
+            return self.crawl_charity_details(charity)
+        except Exception as error:
+            print('Warning: Could not fetch details for ' + charity['UEN No'] + ': ' + str(error))
+            return False
+
+    def crawl_charity_details(self, charity):
+        if not charity['Details URL']:
+            return True
+
+        details_url = urljoin(CHARITIES_GOV_SG_DETAILS_BASE_URL, charity['Details URL'])
+        request = self.http.request('GET', details_url)
+        if request.status != 200:
+            print('Warning: Could not fetch details for ' + charity['UEN No'])
+            return False
+
+        details = self.get_details_from_page_html(request.data.decode("UTF-8"))
+
+        cache_filepath = self.generate_cache_filepath(charity['UEN No'])
+        temporary_filepath = cache_filepath + '.tmp'
+        with open(temporary_filepath, 'w') as file_out:
+            json.dump({'details_url': charity['Details URL'], 'details': details,
+                       'fetched_at': time.time()}, file_out)
+        os.replace(temporary_filepath, cache_filepath)
+
+        return True
+
+    def get_details_from_page_html(self, page_html):
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(page_html, 'html.parser')
+
+        details = {}
+        for label_element in soup.find_all(LABEL_ELEMENT_NAMES):
+            label = label_element.get_text(" ", strip=True).rstrip(':').strip().lower()
+            column = self.column_by_label.get(label)
+            if column is None or column in details:
+                continue
+
+            value_element = label_element.find_next_sibling(VALUE_ELEMENT_NAMES) \
+                or label_element.find_next(VALUE_ELEMENT_NAMES)
+            if value_element is None:
+                continue
+
+            details[column] = WHITESPACE_RUN_PATTERN.sub(
+                " ", value_element.get_text(" ", strip=True))
+
+        return details
+
+    def generate_cache_filepath(self, uen):
+        cache_filename = UNSAFE_FILENAME_CHARACTER_PATTERN.sub("_", uen) + '.json'
+        return os.path.join(self.cache_path, cache_filename)
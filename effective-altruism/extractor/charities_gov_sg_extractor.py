@@ -1,47 +1,201 @@
 import csv
 import itertools
-import json
 import math
+import os
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor
 
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.common.exceptions import NoSuchElementException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.wait import WebDriverWait
+from charities_gov_sg_detail_crawler import CHARITIES_GOV_SG_DETAILS_CACHE_PATH, \
+    CharitiesGovSgDetailCrawler
+from charity import Charity, charities_as_dicts
+from charity_store import CharityStore
+from compressed_output import open_output, write_json_records
+from freshness_store import FreshnessStore
 
 SELENIUM_CHROME_DRIVER_PATH = '../selenium_drivers/chromedriver'
+SELENIUM_BLOCKED_URL_PATTERNS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.svg', '*.ico', '*.bmp',
+    '*.css', '*.woff', '*.woff2', '*.ttf', '*.eot',
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*',
+]
 
 CHARITIES_GOV_SG_URL = \
     'https://www.charities.gov.sg/_layouts/MCYSCPSearch/MCYSCPSearchCriteriaPage.aspx'
 
+REGISTERED_CHARITIES_SOURCE = 'charitiesgovsg'
+
 REGISTERED_CHARITIES_JSON_DUMP_PATH = '../data/charitiesgovsg.json'
 REGISTERED_CHARITIES_CSV_DUMP_PATH = '../data/charitiesgovsg.csv'
+REGISTERED_CHARITIES_FRESHNESS_PATH = '../data/charitiesgovsg_freshness.json'
+REGISTERED_CHARITIES_OUTPUT_FIELDS = ('country', 'name', 'address', 'cause_area', 'website',
+                                      'email', 'contact_number', 'objectives', 'total_income',
+                                      'total_expenditure', 'financial_year_end', 'contact_person')
+
+CURRENT_PAGE_CSS_SELECTOR = 'span#ctl00_PlaceHolderMain_spPager1 > span'
+RESULT_ROW_CSS_SELECTOR = 'div#ctl00_PlaceHolderMain_divSearchResult tr'
+PAGE_LOAD_TIMEOUT_SECONDS = 10
+PAGE_LOAD_POLL_SECONDS = 0.05
+
+CHARITY_ROW_ID_PREFIX = 'ctl00_PlaceHolderMain_lstSearchResults_ctrl'
+CHARITY_ROW_ID_PATTERN = \
+    re.compile('ctl00_PlaceHolderMain_lstSearchResults_ctrl[0-9]+_trSearchDataList')
+CHARITY_ROW_FIELDS = [
+    ('Name of Organization', 'span', '_lblNameOfOrg'),
+    ('UEN No', 'span', '_lblUENNo'),
+    ('Charity Status', 'span', '_lblCharityStatus'),
+    ('Date of Charity Registration', 'span', '_lblDateOfCharityReg'),
+    ('IPC Status', 'span', '_lblIPCStatus'),
+    ('IPC Period', 'span', '_lblIPCPeriodNo'),
+    ('Address', 'span', '_lblAddress'),
+    ('Website', 'a', '_lblOrgWebsite'),
+    ('Primary sector', 'span', '_lblSector'),
+    ('Details URL', 'input', '_hfViewDetails'),
+]
+
+PARSE_CHUNK_PAGES = 50
+
+EXTRACTION_MODE_HTML = 'html'
+EXTRACTION_MODE_SCRIPT = 'script'
+
+RECORDED_PAGES_ARCHIVE_NAME = 'charitiesgovsg/pages.json'
+
+# returns one array of raw field values per result row, in CHARITY_ROW_FIELDS order
+EXTRACT_PAGE_ROWS_SCRIPT = '''
+var idPrefix = arguments[0];
+var rowFields = arguments[1];
+var rows = document.querySelectorAll(
+    'div#ctl00_PlaceHolderMain_divSearchResult tr[id^="' + idPrefix + '"][id$="_trSearchDataList"]');
+
+return Array.prototype.map.call(rows, function (row, index) {
+    return rowFields.map(function (rowField) {
+        var element = document.getElementById(idPrefix + index + rowField[1]);
+        if (element === null) {
+            return null;
+        }
+
+        return rowField[0] === 'input' ? element.getAttribute('value') : element.textContent;
+    });
+});
+'''
 
 
 class CharitiesGovSgExtractor:
+    freshness_store = FreshnessStore(REGISTERED_CHARITIES_FRESHNESS_PATH)
+    charity_store = CharityStore()
+    output_compression = None
+    json_dump_path = REGISTERED_CHARITIES_JSON_DUMP_PATH
+    csv_dump_path = REGISTERED_CHARITIES_CSV_DUMP_PATH
+    extraction_mode = EXTRACTION_MODE_HTML
+    enrich_with_details = True
+    parse_workers = os.cpu_count() or 1
+    details_cache_path = CHARITIES_GOV_SG_DETAILS_CACHE_PATH
+    traffic_archive = None
+
     def do_scrape(self):
+        # a replay parses the recorded pages without a browser
+        if self.traffic_archive is not None and self.traffic_archive.is_replaying():
+            recorded_pages = self.traffic_archive.get_json(RECORDED_PAGES_ARCHIVE_NAME)
+            source_fingerprint = None
+            registered_charities = self.parse_charities_from_pages(
+                recorded_pages['pages'], recorded_pages['extraction_mode'])
+        else:
+            # the browser is only needed for the search result pages
+            browser = self.create_browser()
+            try:
+                self.go_to_search_results_first_page(browser)
+
+                source_fingerprint = self.get_source_fingerprint(browser)
+                if self.freshness_store.is_unchanged(
+                        source_fingerprint,
+                        [self.json_dump_path, self.csv_dump_path]):
+                    print('Source unchanged, reusing ' + self.json_dump_path)
+                    return
+
+                registered_charities = self.scrape_registered_charities(browser)
+            finally:
+                browser.quit()
+
+        uncrawled_details = 0
+        if self.enrich_with_details:
+            detail_crawler = self.create_detail_crawler()
+            registered_charities = detail_crawler.enrich(registered_charities)
+            uncrawled_details = detail_crawler.uncrawled_count
+
+        charities_standardized = self.convert_to_standardized_columns(registered_charities)
+        charities_columns_standardized = charities_as_dicts(
+            charities_standardized, REGISTERED_CHARITIES_OUTPUT_FIELDS)
+
+        self.write_list_as_json_to_file(
+            self.json_dump_path, charities_columns_standardized)
+        self.write_list_as_csv_to_file(
+            self.csv_dump_path, charities_columns_standardized)
+
+        self.charity_store.write_charities(REGISTERED_CHARITIES_SOURCE, charities_standardized)
+        # details that could not be crawled are tried again by the next run
+        if not uncrawled_details:
+            self.freshness_store.update_fingerprint(source_fingerprint)
+
+    def create_detail_crawler(self):
+        detail_crawler = CharitiesGovSgDetailCrawler(self.details_cache_path)
+        if self.traffic_archive is not None:
+            detail_crawler.http = self.traffic_archive.create_scheduler(detail_crawler.http)
+
+        return detail_crawler
+
+    @staticmethod
+    def create_browser():
+        from selenium import webdriver
+        from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
+
         chrome_options = webdriver.ChromeOptions()
         chrome_options.add_argument('headless')
+        chrome_options.add_argument('blink-settings=imagesEnabled=false')
+        chrome_options.add_argument('disable-extensions')
+        chrome_options.add_experimental_option('prefs', {
+            'profile.managed_default_content_settings.images': 2,
+            'profile.managed_default_content_settings.plugins': 2,
+            'profile.managed_default_content_settings.popups': 2,
+            'profile.managed_default_content_settings.notifications': 2,
+        })
+
+        capabilities = DesiredCapabilities.CHROME.copy()
+        capabilities['pageLoadStrategy'] = 'eager'
+
         browser = webdriver.Chrome(
             executable_path=SELENIUM_CHROME_DRIVER_PATH,
-            chrome_options=chrome_options)
+            chrome_options=chrome_options,
+            desired_capabilities=capabilities)
 
-        registered_charities = self.scrape_registered_charities(browser)
+        # the browser is only quit by do_scrape once it is returned
+        try:
+            CharitiesGovSgExtractor.block_urls(browser)
+        except BaseException:
+            browser.quit()
+            raise
 
-        charities_columns_standardized \
-            = self.convert_to_standardized_columns(registered_charities)
+        return browser
 
-        self.write_list_as_json_to_file(
-            REGISTERED_CHARITIES_JSON_DUMP_PATH, charities_columns_standardized)
-        self.write_list_as_csv_to_file(
-            REGISTERED_CHARITIES_CSV_DUMP_PATH, charities_columns_standardized)
+    # request interception needs the devtools protocol, which older drivers such as
+    # chromedriver 2.35 lack; the profile prefs alone then block images and plugins
+    @staticmethod
+    def block_urls(browser):
+        from selenium.common.exceptions import WebDriverException
 
-    def scrape_registered_charities(self, browser):
-        page_tables = []
+        try:
+            browser.execute_cdp_cmd('Network.enable', {})
+            browser.execute_cdp_cmd('Network.setBlockedURLs',
+                                    {'urls': SELENIUM_BLOCKED_URL_PATTERNS})
+        except (AttributeError, WebDriverException):
+            print('Warning: ChromeDriver cannot block requests, only the profile prefs apply')
 
-        self.go_to_search_results_first_page(browser)
+    def get_source_fingerprint(self, browser):
+        return self.freshness_store.generate_fingerprint(
+            self.get_expected_pages(browser), self.extract_current_page_table(browser))
+
+    def scrape_registered_charities(self, browser):
+        pages = []
+        self.page_load_wait_seconds = []
 
         current_page = self.get_current_page(browser)
         expected_pages = self.get_expected_pages(browser)
@@ -50,21 +204,38 @@ class CharitiesGovSgExtractor:
         while True:
             print('Current page: ' + str(current_page))
 
-            page_tables.append(self.extract_current_page_table(browser))
+            if self.extraction_mode == EXTRACTION_MODE_SCRIPT:
+                pages.append(self.extract_current_page_rows(browser))
+            else:
+                pages.append(self.extract_current_page_table(browser))
 
             if not self.has_next_page(browser, current_page):
                 break
 
+            previous_page_row = browser.find_element_by_css_selector(RESULT_ROW_CSS_SELECTOR)
             self.go_to_next_page(browser, current_page)
-            self.wait_for_page_load(browser)
+            wait_seconds = self.wait_for_page_load(browser, current_page + 1, previous_page_row)
+            self.page_load_wait_seconds.append(wait_seconds)
+            print('Page load wait: {:.2f}s'.format(wait_seconds))
+
             current_page = self.get_current_page(browser)
 
         if current_page < expected_pages:
             print('Warning: Did not reach last page')
 
-        charities = self.parse_charities_from_page_tables(page_tables)
+        print('Total page load wait: {:.2f}s'.format(sum(self.page_load_wait_seconds)))
 
-        return charities
+        if self.traffic_archive is not None:
+            self.traffic_archive.put_json(RECORDED_PAGES_ARCHIVE_NAME,
+                                          {'extraction_mode': self.extraction_mode, 'pages': pages})
+
+        return self.parse_charities_from_pages(pages, self.extraction_mode)
+
+    def parse_charities_from_pages(self, pages, extraction_mode):
+        if extraction_mode == EXTRACTION_MODE_SCRIPT:
+            return self.parse_charities_from_page_rows(pages)
+
+        return self.parse_charities_from_page_tables(pages)
 
     @staticmethod
     def extract_current_page_table(browser):
@@ -72,94 +243,92 @@ class CharitiesGovSgExtractor:
         table_parent_element = browser.find_element_by_xpath(table_parent_element_xpath)
         return table_parent_element.get_attribute('innerHTML')
 
-    def extract_charities(self, page_table_html):
-        charities = []
+    def extract_charity_rows(self, page_table_html):
+        from bs4 import BeautifulSoup
 
         soup = BeautifulSoup(page_table_html, 'html.parser')
-        charity_tr_class = \
-            re.compile('ctl00_PlaceHolderMain_lstSearchResults_ctrl[0-9]+_trSearchDataList')
-        matched_charities_tag = soup.find_all('tr', id=charity_tr_class)
-        for index in range(0, len(matched_charities_tag)):
-            charity_tr_tag = matched_charities_tag[index]
+        matched_charities_tag = soup.find_all('tr', id=CHARITY_ROW_ID_PATTERN)
 
-            charity = self.extract_charity_from_tr(charity_tr_tag, index)
-            charity['country'] = 'Singapore'
+        return [self.extract_charity_row_from_tr(charity_tr_tag, index)
+                for index, charity_tr_tag in enumerate(matched_charities_tag)]
 
-            charities.append(charity)
+    @staticmethod
+    def extract_charity_row_from_tr(charity_tr_tag, index):
+        charity_row = []
+        for field_name, tag_name, id_suffix in CHARITY_ROW_FIELDS:
+            element = charity_tr_tag.find(
+                tag_name, id=CHARITY_ROW_ID_PREFIX + str(index) + id_suffix)
+            field_value = element['value'] if tag_name == 'input' else element.text
+            charity_row.append(field_value.strip())
 
-        return charities
+        return tuple(charity_row)
 
     @staticmethod
-    def extract_charity_from_tr(charity_tr_tag, index):
-        index = str(index)
-        return {
-            'Name of Organization':
-                charity_tr_tag.find('span',
-                                    id='ctl00_PlaceHolderMain_lstSearchResults_ctrl' + index + '_lblNameOfOrg').text.strip(),
-            'UEN No':
-                charity_tr_tag.find('span',
-                                    id='ctl00_PlaceHolderMain_lstSearchResults_ctrl' + index + '_lblUENNo').text.strip(),
-            'Charity Status':
-                charity_tr_tag.find('span',
-                                    id='ctl00_PlaceHolderMain_lstSearchResults_ctrl' + index + '_lblCharityStatus').text.strip(),
-            'Date of Charity Registration':
-                charity_tr_tag.find('span',
-                                    id='ctl00_PlaceHolderMain_lstSearchResults_ctrl' + index + '_lblDateOfCharityReg').text.strip(),
-            'IPC Status':
-                charity_tr_tag.find('span',
-                                    id='ctl00_PlaceHolderMain_lstSearchResults_ctrl' + index + '_lblIPCStatus').text.strip(),
-            'IPC Period':
-                charity_tr_tag.find('span',
-                                    id='ctl00_PlaceHolderMain_lstSearchResults_ctrl' + index + '_lblIPCPeriodNo').text.strip(),
-            'Address':
-                charity_tr_tag.find('span',
-                                    id='ctl00_PlaceHolderMain_lstSearchResults_ctrl' + index + '_lblAddress').text.strip(),
-            'Website':
-                charity_tr_tag.find('a',
-                                    id='ctl00_PlaceHolderMain_lstSearchResults_ctrl' + index + '_lblOrgWebsite').text.strip(),
-            'Primary sector':
-                charity_tr_tag.find('span',
-                                    id='ctl00_PlaceHolderMain_lstSearchResults_ctrl' + index + '_lblSector').text.strip(),
-            'Details URL':
-                charity_tr_tag.find('input',
-                                    id='ctl00_PlaceHolderMain_lstSearchResults_ctrl' + index + '_hfViewDetails')[
-                    'value'].strip()
-        }
+    def extract_current_page_rows(browser):
+        return browser.execute_script(
+            EXTRACT_PAGE_ROWS_SCRIPT, CHARITY_ROW_ID_PREFIX,
+            [[tag_name, id_suffix] for _, tag_name, id_suffix in CHARITY_ROW_FIELDS])
 
     @staticmethod
-    def convert_to_standardized_columns(charities):
-        columns_to_remove = ["UEN No", "Charity Status", "Date of Charity Registration",
-                             "IPC Status", "IPC Period", "Details URL"]
+    def extract_charities_from_rows(page_rows):
+        charities = []
 
-        for charity in charities:
-            charity['name'] = charity.pop('Name of Organization')
-            charity['address'] = charity.pop('Address')
-            charity['cause_area'] = charity.pop('Primary sector')
-            charity['website'] = charity.pop('Website')
+        for row in page_rows:
+            charity = {field_name: '' if field_value is None else field_value.strip()
+                       for (field_name, _, _), field_value in zip(CHARITY_ROW_FIELDS, row)}
+            charity['country'] = 'Singapore'
 
-            for column_name_to_remove in columns_to_remove:
-                del charity[column_name_to_remove]
+            charities.append(charity)
 
         return charities
 
+    @staticmethod
+    def convert_to_standardized_columns(charities):
+        return [
+            Charity(
+                source_key=charity['UEN No'],
+                country=charity['country'],
+                name=charity['Name of Organization'],
+                address=charity['Address'],
+                cause_area=charity['Primary sector'],
+                website=charity['Website'],
+                objectives=charity.get('objectives'),
+                total_income=charity.get('total_income'),
+                total_expenditure=charity.get('total_expenditure'),
+                financial_year_end=charity.get('financial_year_end'),
+                contact_person=charity.get('contact_person'),
+                email=charity.get('email'),
+                contact_number=charity.get('contact_number'))
+            for charity in charities]
+
+    # workers send back plain tuples, which are much cheaper to pickle than dicts
     def parse_charities_from_page_tables(self, page_tables):
-        charities_unflattened = [self.extract_charities(page_table) for page_table in page_tables]
+        if self.parse_workers <= 1 or len(page_tables) <= PARSE_CHUNK_PAGES:
+            return self.parse_charities_from_page_rows(extract_page_tables_rows(page_tables))
+
+        page_table_chunks = [page_tables[start_index:start_index + PARSE_CHUNK_PAGES]
+                             for start_index in range(0, len(page_tables), PARSE_CHUNK_PAGES)]
+        with ProcessPoolExecutor(max_workers=self.parse_workers) as executor:
+            pages_rows = list(itertools.chain.from_iterable(
+                executor.map(extract_page_tables_rows, page_table_chunks)))
+
+        return self.parse_charities_from_page_rows(pages_rows)
+
+    def parse_charities_from_page_rows(self, pages_rows):
+        charities_unflattened = [self.extract_charities_from_rows(page_rows)
+                                 for page_rows in pages_rows]
         charities = list(itertools.chain.from_iterable(charities_unflattened))
         return charities
 
     # HELPER FUNCTIONS
     def go_to_next_page(self, browser, current_page):
-        back_to_top_xpath = '//*[@id="backToTop"]'
-        self.move_to_element(browser, back_to_top_xpath)
-
         next_page_element_xpath = self.generate_next_page_element_xpath(current_page)
-        self.move_to_and_click_element(browser, next_page_element_xpath)
+        self.click_element(browser, next_page_element_xpath)
 
     @staticmethod
     def get_current_page(browser):
-        current_page_css_selector = 'span#ctl00_PlaceHolderMain_spPager1 > span'
         current_page = browser \
-            .find_element_by_css_selector(current_page_css_selector) \
+            .find_element_by_css_selector(CURRENT_PAGE_CSS_SELECTOR) \
             .text
 
         return int(current_page)
@@ -170,6 +339,8 @@ class CharitiesGovSgExtractor:
             current_page + 1) + '\']'
 
     def has_next_page(self, browser, current_page):
+        from selenium.common.exceptions import NoSuchElementException
+
         next_page_element_xpath = self.generate_next_page_element_xpath(current_page)
         try:
             browser.find_element_by_xpath(next_page_element_xpath)
@@ -194,44 +365,63 @@ class CharitiesGovSgExtractor:
         browser.get(CHARITIES_GOV_SG_URL)
 
         search_button_xpath = '//*[@id="ctl00_PlaceHolderMain_btnSearch"]'
-        self.move_to_and_click_element(browser, search_button_xpath)
+        self.click_element(browser, search_button_xpath)
 
-        self.wait_for_page_load(browser)
+        self.wait_for_page_load(browser, 1)
 
+    # the pager is visible before the postback finishes, so wait for the old
+    # rows to be replaced and for the pager to show the requested page instead
     @staticmethod
-    def wait_for_page_load(browser):
-        pagination_css_selector = 'span#ctl00_PlaceHolderMain_spPager1'
-        WebDriverWait(browser, 10).until(
-            EC.visibility_of_element_located((By.CSS_SELECTOR, pagination_css_selector)))
+    def wait_for_page_load(browser, expected_page, previous_page_element=None):
+        from selenium.common.exceptions import NoSuchElementException, \
+            StaleElementReferenceException
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.wait import WebDriverWait
 
-    @staticmethod
-    def move_to_and_click_element(browser, element_xpath):
-        element = browser.find_element_by_xpath(element_xpath)
+        started_at = time.monotonic()
+        wait = WebDriverWait(browser, PAGE_LOAD_TIMEOUT_SECONDS,
+                             poll_frequency=PAGE_LOAD_POLL_SECONDS,
+                             ignored_exceptions=[NoSuchElementException,
+                                                 StaleElementReferenceException])
 
-        webdriver.ActionChains(browser) \
-            .move_to_element(element) \
-            .click(element) \
-            .perform()
+        if previous_page_element is not None:
+            wait.until(EC.staleness_of(previous_page_element))
 
+        wait.until(lambda driver: driver.find_element(
+            By.CSS_SELECTOR, CURRENT_PAGE_CSS_SELECTOR).text == str(expected_page))
+
+        return time.monotonic() - started_at
+
+    # a scripted click needs no scrolling or simulated mouse movement
     @staticmethod
-    def move_to_element(browser, element_xpath):
+    def click_element(browser, element_xpath):
         element = browser.find_element_by_xpath(element_xpath)
+        browser.execute_script('arguments[0].click();', element)
 
-        webdriver.ActionChains(browser) \
-            .move_to_element(element) \
-            .perform()
+    def write_list_as_json_to_file(self, filepath, list_of_dicts):
+        with open_output(filepath, self.output_compression) as file_out:
+            write_json_records(file_out, list_of_dicts)
 
+    # enrichment columns are only present for charities whose detail page was parsed
     @staticmethod
-    def write_list_as_json_to_file(filepath, list_of_dicts):
-        with open(filepath, 'w') as file_out:
-            json.dump(list_of_dicts, file_out)
+    def get_all_possible_fieldnames(list_of_dicts):
+        fieldnames = {}
+        for charity in list_of_dicts:
+            fieldnames.update(dict.fromkeys(charity))
 
-    @staticmethod
-    def write_list_as_csv_to_file(filepath, list_of_dicts):
-        with open(filepath, mode='w', newline="\n") as csv_file:
-            fieldnames = list_of_dicts[0].keys()
+        return list(fieldnames)
+
+    def write_list_as_csv_to_file(self, filepath, list_of_dicts):
+        with open_output(filepath, self.output_compression, newline="\n") as csv_file:
+            fieldnames = self.get_all_possible_fieldnames(list_of_dicts)
             csv_file_writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
 
             csv_file_writer.writeheader()
             for charity in list_of_dicts:
                 csv_file_writer.writerow(charity)
+
+
+def extract_page_tables_rows(page_tables):
+    extractor = CharitiesGovSgExtractor()
+    return [extractor.extract_charity_rows(page_table) for page_table in page_tables]
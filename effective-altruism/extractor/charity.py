@@ -0,0 +1,38 @@
+CHARITY_FIELDS = ('name', 'website', 'cause_area', 'description', 'address',
+                  'email', 'contact_number', 'country', 'location',
+                  'objectives', 'total_income', 'total_expenditure', 'financial_year_end',
+                  'contact_person')
+
+
+# source_key identifies a record within its source, e.g. a UEN for charities.gov.sg;
+# it is only used by the charity store and is not part of the output files
+CHARITY_RECORD_FIELDS = CHARITY_FIELDS + ('source_key',)
+
+
+class Charity:
+    __slots__ = CHARITY_RECORD_FIELDS
+
+    def __init__(self, **fields):
+        for field in CHARITY_RECORD_FIELDS:
+            setattr(self, field, fields.pop(field, None))
+
+        if fields:
+            raise TypeError('Unknown charity fields: ' + ', '.join(fields))
+
+    # fields a source does not provide stay None and are left out of its output; a source
+    # passes its own field order to keep the column order of its files
+    def as_dict(self, fields=CHARITY_FIELDS):
+        charity_dict = {}
+        for field in fields:
+            value = getattr(self, field)
+            if value is not None:
+                charity_dict[field] = value
+
+        return charity_dict
+
+    def __repr__(self):
+        return 'Charity(' + repr(self.as_dict()) + ')'
+
+
+def charities_as_dicts(charities, fields=CHARITY_FIELDS):
+    return [charity.as_dict(fields) for charity in charities]
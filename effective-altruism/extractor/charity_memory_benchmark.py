@@ -0,0 +1,77 @@
+import gc
+import time
+import tracemalloc
+
+from charity import Charity
+
+BENCHMARK_RECORD_COUNT = 100000
+BENCHMARK_RAW_EXTRA_COLUMNS = 30
+
+
+def generate_raw_charities(count):
+    return [{
+        'orgname': 'Organization ' + str(index),
+        'countryname': 'Country ' + str(index % 200),
+        'projtitle': 'Project ' + str(index),
+        'projsummary': 'Summary of project ' + str(index),
+        **{'raw_column_' + str(column): str(index * column)
+           for column in range(BENCHMARK_RAW_EXTRA_COLUMNS)}
+    } for index in range(count)]
+
+
+def convert_with_dict_mutation(charities):
+    columns_to_keep = ["name", "country", "description"]
+
+    for charity in charities:
+        charity['name'] = charity.get('orgname', '')
+        charity['country'] = charity.get('countryname', '')
+        charity['description'] \
+            = charity.get('projtitle', '') + ": " + charity.get('projsummary', '')
+
+        for column_name in list(charity.keys()):
+            if column_name not in columns_to_keep:
+                del charity[column_name]
+
+    return charities
+
+
+def convert_with_charity_records(charities):
+    return [
+        Charity(
+            name=charity.get('orgname', ''),
+            country=charity.get('countryname', ''),
+            description=charity.get('projtitle', '') + ": " + charity.get('projsummary', ''))
+        for charity in charities]
+
+
+def measure(convert):
+    gc.collect()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+
+    raw_charities = generate_raw_charities(BENCHMARK_RECORD_COUNT)
+
+    started_at = time.perf_counter()
+    charities = convert(raw_charities)
+    elapsed_seconds = time.perf_counter() - started_at
+
+    del raw_charities
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    del charities
+    return elapsed_seconds, retained - baseline, peak - baseline
+
+
+def main():
+    print('Records: ' + str(BENCHMARK_RECORD_COUNT))
+
+    for label, convert in [('dict mutation', convert_with_dict_mutation),
+                           ('charity records', convert_with_charity_records)]:
+        elapsed_seconds, retained_bytes, peak_bytes = measure(convert)
+        print('{:<16} time: {:7.3f}s  retained: {:8.1f} MiB  peak: {:8.1f} MiB'.format(
+            label, elapsed_seconds, retained_bytes / 2 ** 20, peak_bytes / 2 ** 20))
+
+
+main()
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import sqlite3
+import time
+
+from charity import CHARITY_FIELDS
+
+CHARITY_STORE_PATH = '../data/charities.sqlite3'
+
+CHARITY_STORE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    record_count INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS charities (
+    source TEXT NOT NULL,
+    natural_key TEXT NOT NULL,
+    {charity_columns},
+    record_hash TEXT NOT NULL,
+    first_seen_run_id INTEGER NOT NULL,
+    last_seen_run_id INTEGER NOT NULL,
+    PRIMARY KEY (source, natural_key)
+);
+CREATE INDEX IF NOT EXISTS charities_country ON charities (country);
+CREATE INDEX IF NOT EXISTS charities_cause_area ON charities (cause_area);
+
+CREATE TABLE IF NOT EXISTS charity_versions (
+    source TEXT NOT NULL,
+    natural_key TEXT NOT NULL,
+    valid_from_run_id INTEGER NOT NULL,
+    valid_to_run_id INTEGER,
+    record_hash TEXT NOT NULL,
+    record TEXT NOT NULL,
+    PRIMARY KEY (source, natural_key, valid_from_run_id)
+);
+CREATE INDEX IF NOT EXISTS charity_versions_open
+    ON charity_versions (source, valid_to_run_id);
+'''.format(charity_columns=',\n    '.join(field + ' TEXT' for field in CHARITY_FIELDS))
+
+UPSERT_CHARITY_SQL = '''
+INSERT INTO charities (source, natural_key, {columns}, record_hash,
+                       first_seen_run_id, last_seen_run_id)
+VALUES (?, ?, {placeholders}, ?, ?, ?)
+ON CONFLICT (source, natural_key) DO UPDATE SET
+    {updates}, record_hash = excluded.record_hash, last_seen_run_id = excluded.last_seen_run_id
+'''.format(columns=', '.join(CHARITY_FIELDS),
+           placeholders=', '.join('?' for _ in CHARITY_FIELDS),
+           updates=', '.join(field + ' = excluded.' + field for field in CHARITY_FIELDS))
+
+
+# every run upserts the current table in one transaction and keeps a version
+# history, so any earlier run can be rebuilt without keeping full copies of it
+class CharityStore:
+    def __init__(self, filepath=CHARITY_STORE_PATH):
+        self.filepath = filepath
+        self.connection = None
+
+    def get_connection(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.filepath)
+            self.connection.execute('PRAGMA journal_mode = WAL')
+            self.connection.execute('PRAGMA synchronous = NORMAL')
+            self.connection.executescript(CHARITY_STORE_SCHEMA)
+
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def write_charities(self, source, charities):
+        connection = self.get_connection()
+
+        with connection:
+            run_id = connection.execute(
+                'INSERT INTO runs (source, started_at) VALUES (?, ?)',
+                (source, time.time())).lastrowid
+
+            connection.execute('DROP TABLE IF EXISTS temp.incoming')
+            connection.execute(
+                'CREATE TEMP TABLE incoming ('
+                'natural_key TEXT PRIMARY KEY, record_hash TEXT, record TEXT, '
+                + ', '.join(field + ' TEXT' for field in CHARITY_FIELDS) + ')')
+            written_count = connection.executemany(
+                'INSERT OR REPLACE INTO temp.incoming VALUES (?, ?, ?, '
+                + ', '.join('?' for _ in CHARITY_FIELDS) + ')',
+                map(self.generate_incoming_row, charities)).rowcount
+
+            self.write_versions(connection, source, run_id)
+
+            connection.executemany(
+                UPSERT_CHARITY_SQL,
+                ((source, natural_key, *values, record_hash, run_id, run_id)
+                 for natural_key, record_hash, _, *values
+                 in connection.execute('SELECT * FROM temp.incoming').fetchall()))
+
+            # charities that dropped out of the source stay in the version history only
+            connection.execute(
+                'DELETE FROM charities WHERE source = ? AND last_seen_run_id != ?',
+                (source, run_id))
+
+            # a charity written twice under one natural key is kept once, as its last record
+            record_count = connection.execute(
+                'SELECT COUNT(*) FROM temp.incoming').fetchone()[0]
+            if written_count > record_count:
+                print('Warning: Charities sharing a natural key with another in ' + source + ': '
+                      + str(written_count - record_count))
+            connection.execute(
+                'UPDATE runs SET finished_at = ?, record_count = ? WHERE run_id = ?',
+                (time.time(), record_count, run_id))
+            connection.execute('DROP TABLE temp.incoming')
+
+        return run_id
+
+    @staticmethod
+    def write_versions(connection, source, run_id):
+        connection.execute(
+            'UPDATE charity_versions SET valid_to_run_id = ? '
+            'WHERE source = ? AND valid_to_run_id IS NULL AND NOT EXISTS ('
+            'SELECT 1 FROM temp.incoming AS incoming '
+            'WHERE incoming.natural_key = charity_versions.natural_key '
+            'AND incoming.record_hash = charity_versions.record_hash)',
+            (run_id, source))
+        connection.execute(
+            'INSERT INTO charity_versions '
+            'SELECT ?, incoming.natural_key, ?, NULL, incoming.record_hash, incoming.record '
+            'FROM temp.incoming AS incoming WHERE NOT EXISTS ('
+            'SELECT 1 FROM charity_versions AS versions '
+            'WHERE versions.source = ? AND versions.natural_key = incoming.natural_key '
+            'AND versions.valid_to_run_id IS NULL)',
+            (source, run_id, source))
+
+    @staticmethod
+    def generate_incoming_row(charity):
+        record = json.dumps(charity.as_dict(), sort_keys=True)
+        record_hash = hashlib.sha1(record.encode('utf-8')).hexdigest()
+        natural_key = charity.source_key or charity.name
+
+        return (natural_key, record_hash, record,
+                *[getattr(charity, field) for field in CHARITY_FIELDS])
+
+    def find_charities(self, source=None, country=None, cause_area=None):
+        conditions = [(column, value) for column, value
+                      in [('source', source), ('country', country), ('cause_area', cause_area)]
+                      if value is not None]
+        where_clause = ' AND '.join(column + ' = ?' for column, _ in conditions) or '1'
+
+        cursor = self.get_connection().execute(
+            'SELECT ' + ', '.join(CHARITY_FIELDS) + ' FROM charities WHERE ' + where_clause,
+            [value for _, value in conditions])
+
+        return [{field: value for field, value in zip(CHARITY_FIELDS, row) if value is not None}
+                for row in cursor]
+
+    def get_runs(self, source):
+        cursor = self.get_connection().execute(
+            'SELECT run_id, started_at, finished_at, record_count FROM runs '
+            'WHERE source = ? ORDER BY run_id', (source,))
+
+        return [{'run_id': run_id, 'started_at': started_at,
+                 'finished_at': finished_at, 'record_count': record_count}
+                for run_id, started_at, finished_at, record_count in cursor]
+
+    def export_run(self, run_id):
+        cursor = self.get_connection().execute(
+            'SELECT versions.record FROM charity_versions AS versions '
+            'JOIN runs ON runs.source = versions.source AND runs.run_id = ? '
+            'WHERE versions.valid_from_run_id <= ? '
+            'AND (versions.valid_to_run_id IS NULL OR versions.valid_to_run_id > ?) '
+            'ORDER BY versions.natural_key',
+            (run_id, run_id, run_id))
+
+        return [json.loads(record) for record, in cursor]
+
+    def export_changes_since(self, source, run_id):
+        cursor = self.get_connection().execute(
+            'SELECT record FROM charity_versions '
+            'WHERE source = ? AND valid_from_run_id > ? AND valid_to_run_id IS NULL '
+            'ORDER BY natural_key',
+            (source, run_id))
+
+        return [json.loads(record) for record, in cursor]
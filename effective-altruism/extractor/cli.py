@@ -0,0 +1,242 @@
+import argparse
+import importlib
+import os
+import sys
+import time
+from collections import namedtuple
+
+from charity import CHARITY_FIELDS
+from charity_store import CHARITY_STORE_PATH, CharityStore
+from compressed_output import COMPRESSION_GZIP, COMPRESSION_ZSTD, find_output_path, \
+    read_csv_records, read_json_records
+from dataset_export import DATASET_EXPORT_WORKERS, DATASET_OUTPUT_PATH, DATASET_SHARD_COUNT, \
+    export_dataset
+
+# sources are named by module and class, so list, status and validate never import
+# an extractor; scrape imports only the one it runs
+Source = namedtuple('Source', ['module', 'class_name', 'method', 'json_path', 'csv_path'])
+
+SOURCES = {
+    'cafa': Source('cafa_extractor', 'CafaExtractor', 'do_scrape',
+                   '../data/cafa.json', '../data/cafa.csv'),
+    'charitiesgovsg': Source('charities_gov_sg_extractor', 'CharitiesGovSgExtractor', 'do_scrape',
+                             '../data/charitiesgovsg.json', '../data/charitiesgovsg.csv'),
+    'epicfoundation': Source('epic_foundation_extractor', 'EpicFoundationExtractor', 'do_scrape',
+                             '../data/epicfoundation.json', '../data/epicfoundation.csv'),
+    'globalgiving': Source('globalgiving_extractor', 'GlobalGivingExtractor', 'do_scrape',
+                           '../data/globalgiving.json', '../data/globalgiving.csv'),
+    'oilseedcrops': Source('oilseedcrops_extractor', 'OilSeedCropsExtractor', 'do_extract',
+                           '../data/oilseedcrops.json', '../data/oilseedcrops.csv'),
+    'oneworld365': Source('oneworld365_extractor', 'OneWorld365Extractor', 'do_scrape',
+                          '../data/oneworld365.json', '../data/oneworld365.csv'),
+}
+
+
+def list_sources(args):
+    for source_name in SOURCES:
+        print(source_name)
+
+    return 0
+
+
+def show_status(args):
+    last_runs = get_last_runs()
+
+    for source_name in args.sources or SOURCES:
+        source = SOURCES[source_name]
+        print(source_name)
+        print('  output: ' + describe_file(source.json_path))
+
+        last_run = last_runs.get(source_name)
+        if last_run is None:
+            print('  last run: none')
+        else:
+            run_id, finished_at, record_count = last_run
+            print('  last run: #{} at {}, {} records'.format(
+                run_id, format_timestamp(finished_at), record_count))
+
+    return 0
+
+
+def get_last_runs():
+    if not os.path.exists(CHARITY_STORE_PATH):
+        return {}
+
+    charity_store = CharityStore(CHARITY_STORE_PATH)
+    try:
+        cursor = charity_store.get_connection().execute(
+            'SELECT source, run_id, finished_at, record_count FROM runs '
+            'WHERE run_id IN (SELECT MAX(run_id) FROM runs GROUP BY source)')
+        return {source: (run_id, finished_at, record_count)
+                for source, run_id, finished_at, record_count in cursor}
+    finally:
+        charity_store.close()
+
+
+def describe_file(filepath):
+    filepath = find_output_path(filepath)
+    if filepath is None:
+        return 'missing'
+
+    return '{} ({} bytes, modified {})'.format(
+        filepath, os.path.getsize(filepath), format_timestamp(os.path.getmtime(filepath)))
+
+
+def format_timestamp(timestamp):
+    if timestamp is None:
+        return 'unfinished'
+
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
+
+
+def validate_outputs(args):
+    invalid_sources = 0
+
+    for source_name in args.sources or SOURCES:
+        problems = get_output_problems(SOURCES[source_name])
+        print(source_name + ': ' + ('ok' if not problems else '; '.join(problems)))
+        invalid_sources += bool(problems)
+
+    return 1 if invalid_sources else 0
+
+
+def get_output_problems(source):
+    json_path = find_output_path(source.json_path)
+    csv_path = find_output_path(source.csv_path)
+    if json_path is None or csv_path is None:
+        return ['output missing']
+
+    try:
+        charities = list(read_json_records(json_path))
+    except ValueError as error:
+        return ['invalid json: ' + str(error)]
+
+    if not all(isinstance(charity, dict) for charity in charities):
+        return ['json output is not a list of records']
+
+    problems = []
+    unknown_fields = {field for charity in charities for field in charity} - set(CHARITY_FIELDS)
+    if unknown_fields:
+        problems.append('unknown fields: ' + ', '.join(sorted(unknown_fields)))
+
+    unnamed_charities = sum(1 for charity in charities if not charity.get('name'))
+    if unnamed_charities:
+        problems.append('charities without a name: ' + str(unnamed_charities))
+
+    csv_rows = sum(1 for _ in read_csv_records(csv_path))
+    if csv_rows != len(charities):
+        problems.append('csv has {} rows, json has {}'.format(csv_rows, len(charities)))
+
+    return problems
+
+
+def scrape_sources(args):
+    traffic_archive = open_traffic_archive(args)
+
+    try:
+        for source_name in args.sources:
+            source = SOURCES[source_name]
+            extractor_class = getattr(importlib.import_module(source.module), source.class_name)
+            if traffic_archive is not None:
+                from traffic_archive import use_traffic_archive
+
+                use_traffic_archive(extractor_class, traffic_archive,
+                                    os.path.join(traffic_archive.filepath + '.state', source_name))
+
+            print('Scraping ' + source_name)
+            started_at = time.perf_counter()
+            getattr(extractor_class(), source.method)()
+            print('Scraped {} in {:.2f}s'.format(source_name, time.perf_counter() - started_at))
+            if traffic_archive is not None and traffic_archive.is_replaying():
+                print('Replay outputs: ' + extractor_class.json_dump_path + ', '
+                      + extractor_class.csv_dump_path)
+    finally:
+        if traffic_archive is not None:
+            traffic_archive.close()
+
+    return 0
+
+
+def open_traffic_archive(args):
+    if args.record is None and args.replay is None:
+        return None
+
+    from traffic_archive import TRAFFIC_ARCHIVE_RECORD, TRAFFIC_ARCHIVE_REPLAY, TrafficArchive
+
+    if args.record is not None:
+        return TrafficArchive(args.record, TRAFFIC_ARCHIVE_RECORD)
+
+    return TrafficArchive(args.replay, TRAFFIC_ARCHIVE_REPLAY)
+
+
+# choices cannot be combined with an optional list of sources, so names are checked here
+def source_name(value):
+    if value not in SOURCES:
+        raise argparse.ArgumentTypeError(
+            'unknown source {!r}, choose from: {}'.format(value, ', '.join(SOURCES)))
+
+    return value
+
+
+def export_sources(args):
+    source_json_paths = {}
+    for source_name in args.sources or SOURCES:
+        json_path = find_output_path(SOURCES[source_name].json_path)
+        if json_path is None:
+            print('Warning: No output to export for ' + source_name)
+            continue
+        source_json_paths[source_name] = json_path
+
+    if not source_json_paths:
+        print('Nothing to export')
+        return 1
+
+    export_dataset(source_json_paths, args.output, args.shards, args.workers,
+                   args.compression, args.keep_shards)
+    return 0
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(prog='python -m cli')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('list', help='list the registered sources') \
+        .set_defaults(handler=list_sources)
+
+    status_parser = subparsers.add_parser('status', help='show outputs and last runs')
+    status_parser.add_argument('sources', nargs='*', type=source_name, metavar='source')
+    status_parser.set_defaults(handler=show_status)
+
+    validate_parser = subparsers.add_parser('validate', help='check json and csv outputs')
+    validate_parser.add_argument('sources', nargs='*', type=source_name, metavar='source')
+    validate_parser.set_defaults(handler=validate_outputs)
+
+    scrape_parser = subparsers.add_parser('scrape', help='run extractors')
+    scrape_parser.add_argument('sources', nargs='+', type=source_name, metavar='source')
+    traffic_archive_group = scrape_parser.add_mutually_exclusive_group()
+    traffic_archive_group.add_argument(
+        '--record', metavar='ARCHIVE', help='save every response and page to a zip archive')
+    traffic_archive_group.add_argument(
+        '--replay', metavar='ARCHIVE', help='run against a recorded archive, offline')
+    scrape_parser.set_defaults(handler=scrape_sources)
+
+    export_parser = subparsers.add_parser(
+        'export', help='combine source outputs into one dataset sorted by name')
+    export_parser.add_argument('sources', nargs='*', type=source_name, metavar='source')
+    export_parser.add_argument('--output', default=DATASET_OUTPUT_PATH)
+    export_parser.add_argument('--shards', type=int, default=DATASET_SHARD_COUNT)
+    export_parser.add_argument('--workers', type=int, default=DATASET_EXPORT_WORKERS)
+    export_parser.add_argument('--compression', choices=[COMPRESSION_GZIP, COMPRESSION_ZSTD])
+    export_parser.add_argument('--keep-shards', action='store_true')
+    export_parser.set_defaults(handler=export_sources)
+
+    return parser
+
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,242 @@
+import csv
+import gzip
+import io
+import json
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_ZSTD = 'zstd'
+COMPRESSION_EXTENSIONS = {None: '', COMPRESSION_GZIP: '.gz', COMPRESSION_ZSTD: '.zst'}
+
+# level 1 already shrinks text outputs about four times at a fraction of level 6's cost
+GZIP_LEVEL = 1
+GZIP_BLOCK_SIZE = 1024 * 1024
+GZIP_WORKERS = os.cpu_count() or 1
+ZSTD_LEVEL = 3
+JSON_READ_CHUNK_SIZE = 1024 * 1024
+
+
+# blocks are compressed into independent gzip members on a thread pool (zlib releases
+# the GIL) and written in order; concatenated members are a valid gzip file. on a single
+# cpu nothing overlaps with the compression, so it costs more than an uncompressed write
+class ParallelGzipWriter(io.RawIOBase):
+    def __init__(self, filepath, level=GZIP_LEVEL, block_size=GZIP_BLOCK_SIZE,
+                 workers=GZIP_WORKERS):
+        self.file = open(filepath, 'wb')
+        self.level = level
+        self.block_size = block_size
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.pending_blocks = deque()
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= self.block_size:
+            self.submit_block()
+
+        return len(data)
+
+    def submit_block(self):
+        self.pending_blocks.append(
+            self.executor.submit(gzip.compress, bytes(self.buffer), self.level, mtime=0))
+        self.buffer.clear()
+
+        # only a few blocks are in flight, so memory stays bounded for any output size
+        while len(self.pending_blocks) > 2 * self.workers:
+            self.file.write(self.pending_blocks.popleft().result())
+
+    def close(self):
+        if self.closed:
+            return
+
+        try:
+            if self.buffer:
+                self.submit_block()
+            while self.pending_blocks:
+                self.file.write(self.pending_blocks.popleft().result())
+        finally:
+            self.executor.shutdown()
+            self.file.close()
+            super().close()
+
+
+def get_output_path(filepath, compression):
+    if compression not in COMPRESSION_EXTENSIONS:
+        raise ValueError('Unknown compression: ' + str(compression))
+
+    return filepath + COMPRESSION_EXTENSIONS[compression]
+
+
+# the uncompressed file is preferred, then any compressed variant of it
+def find_output_path(filepath):
+    for extension in COMPRESSION_EXTENSIONS.values():
+        if os.path.exists(filepath + extension):
+            return filepath + extension
+
+    return None
+
+
+# written to a temporary file that replaces the output once it closes; a write that
+# fails keeps the previous output, and variants with another compression are removed
+# only after the new output is in place
+class OutputFile(io.TextIOWrapper):
+    def __init__(self, binary_file, filepath, output_path, newline=None):
+        super().__init__(binary_file, encoding='utf-8', newline=newline)
+        self.filepath = filepath
+        self.output_path = output_path
+        self.failed = False
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.failed = exc_type is not None
+        return super().__exit__(exc_type, exc_value, traceback)
+
+    def close(self):
+        if self.closed:
+            return
+
+        try:
+            super().close()
+        except BaseException:
+            self.failed = True
+            raise
+        finally:
+            temporary_path = get_temporary_path(self.output_path)
+            if self.failed:
+                if os.path.exists(temporary_path):
+                    os.remove(temporary_path)
+            else:
+                os.replace(temporary_path, self.output_path)
+                self.remove_other_variants()
+
+    def remove_other_variants(self):
+        for extension in COMPRESSION_EXTENSIONS.values():
+            if self.filepath + extension != self.output_path \
+                    and os.path.exists(self.filepath + extension):
+                os.remove(self.filepath + extension)
+
+
+def get_temporary_path(output_path):
+    return output_path + '.tmp'
+
+
+def open_output(filepath, compression=None, newline=None):
+    output_path = get_output_path(filepath, compression)
+    temporary_path = get_temporary_path(output_path)
+
+    if compression is None:
+        binary_file = io.FileIO(temporary_path, 'w')
+    elif compression == COMPRESSION_GZIP:
+        binary_file = ParallelGzipWriter(temporary_path)
+    else:
+        import zstandard
+
+        binary_file = zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=-1) \
+            .stream_writer(open(temporary_path, 'wb'), closefd=True)
+
+    return OutputFile(io.BufferedWriter(binary_file, GZIP_BLOCK_SIZE), filepath, output_path,
+                      newline=newline)
+
+
+def open_input(filepath, newline=None):
+    if filepath.endswith(COMPRESSION_EXTENSIONS[COMPRESSION_GZIP]):
+        return gzip.open(filepath, 'rt', encoding='utf-8', newline=newline)
+
+    if filepath.endswith(COMPRESSION_EXTENSIONS[COMPRESSION_ZSTD]):
+        import zstandard
+
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(filepath, 'rb')),
+                                encoding='utf-8', newline=newline)
+
+    return open(filepath, newline=newline)
+
+
+# writes a json array with one record per line, so it can be read back a record at a time
+class JsonArrayWriter:
+    def __init__(self, file_out):
+        self.file_out = file_out
+        self.record_count = 0
+        file_out.write('[')
+
+    def write(self, record):
+        self.file_out.write('\n' if self.record_count == 0 else ',\n')
+        self.file_out.write(json.dumps(record))
+        self.record_count += 1
+
+    def close(self):
+        self.file_out.write('\n]' if self.record_count else ']')
+
+
+def write_json_records(file_out, records):
+    json_array_writer = JsonArrayWriter(file_out)
+    for record in records:
+        json_array_writer.write(record)
+    json_array_writer.close()
+
+
+def read_json_records(filepath):
+    with open_input(filepath) as file_in:
+        yield from iterate_json_array(file_in)
+
+
+# decodes one array element at a time from a buffer that is refilled in chunks, so any
+# json array is read with bounded memory whatever its layout
+def iterate_json_array(file_in, chunk_size=JSON_READ_CHUNK_SIZE):
+    decoder = json.JSONDecoder()
+    text, position = skip_json_whitespace(file_in, '', 0, chunk_size)
+    if text[position] != '[':
+        raise ValueError('Expected a json array')
+
+    text, position = skip_json_whitespace(file_in, text, position + 1, chunk_size)
+    if text[position] == ']':
+        return
+
+    while True:
+        while True:
+            try:
+                element, end = decoder.raw_decode(text, position)
+            except ValueError:
+                end = None
+
+            # an element is complete once a delimiter follows it; a number cut off at the
+            # end of the buffer may continue in the next chunk
+            if end is not None and end < len(text) and text[end] in ' \t\r\n,]':
+                break
+
+            chunk = file_in.read(chunk_size)
+            if not chunk:
+                if end is None:
+                    raise ValueError('Unexpected end of json array')
+                break
+            text, position = text[position:] + chunk, 0
+
+        yield element
+
+        text, position = skip_json_whitespace(file_in, text, end, chunk_size)
+        if text[position] == ']':
+            return
+        if text[position] != ',':
+            raise ValueError('Expected , or ] in json array')
+        text, position = skip_json_whitespace(file_in, text, position + 1, chunk_size)
+
+
+def skip_json_whitespace(file_in, text, position, chunk_size):
+    while True:
+        while position < len(text) and text[position] in ' \t\r\n':
+            position += 1
+        if position < len(text):
+            return text, position
+
+        text, position = file_in.read(chunk_size), 0
+        if not text:
+            raise ValueError('Unexpected end of json array')
+
+
+def read_csv_records(filepath):
+    with open_input(filepath, newline='') as file_in:
+        yield from csv.DictReader(file_in)
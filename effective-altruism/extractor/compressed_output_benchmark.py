@@ -0,0 +1,131 @@
+import csv
+import gzip
+import io
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from compressed_output import COMPRESSION_GZIP, COMPRESSION_ZSTD, GZIP_LEVEL, ParallelGzipWriter, \
+    get_output_path, open_output, read_csv_records, read_json_records, write_json_records
+
+BENCHMARK_RECORD_COUNT = 20000
+
+# globalgiving and cafa descriptions are a few sentences of free text
+DESCRIPTION_WORDS = ['children', 'education', 'water', 'health', 'community', 'support',
+                     'women', 'rural', 'access', 'program', 'families', 'Kenya', 'India',
+                     'training', 'clean', 'schools', 'the', 'and', 'to', 'of', 'in', 'for',
+                     'provide', 'improve', 'local', 'youth', 'food', 'security', 'project']
+DESCRIPTION_LENGTHS = [40, 120, 300]
+
+
+def generate_records(count):
+    random.seed(0)
+
+    return [{
+        'name': 'Organization ' + str(index),
+        'country': random.choice(['Kenya', 'India', 'Singapore', 'Myanmar', 'Peru']),
+        'cause_area': random.choice(['Education', 'Health', 'Water, Sanitation']),
+        'description': ' '.join(random.choice(DESCRIPTION_WORDS)
+                                for _ in range(random.choice(DESCRIPTION_LENGTHS))),
+    } for index in range(count)]
+
+
+def write_outputs(json_file, csv_file, records):
+    write_json_records(json_file, records)
+
+    csv_file_writer = csv.DictWriter(csv_file, fieldnames=list(records[0]))
+    csv_file_writer.writeheader()
+    for record in records:
+        csv_file_writer.writerow(record)
+
+
+def write_with_open_output(json_filepath, csv_filepath, records, compression):
+    with open_output(json_filepath, compression) as json_file, \
+            open_output(csv_filepath, compression, newline="\n") as csv_file:
+        write_outputs(json_file, csv_file, records)
+
+    return [get_output_path(json_filepath, compression),
+            get_output_path(csv_filepath, compression)]
+
+
+def write_with_gzip_open(json_filepath, csv_filepath, records):
+    with gzip.open(json_filepath + '.gz', 'wt', encoding='utf-8') as json_file, \
+            gzip.open(csv_filepath + '.gz', 'wt', encoding='utf-8', newline="\n") as csv_file:
+        write_outputs(json_file, csv_file, records)
+
+    return [json_filepath + '.gz', csv_filepath + '.gz']
+
+
+def write_with_parallel_gzip(json_filepath, csv_filepath, records, level=GZIP_LEVEL):
+    writers = [ParallelGzipWriter(json_filepath + '.gz', level=level),
+               ParallelGzipWriter(csv_filepath + '.gz', level=level)]
+    with open_text(writers[0]) as json_file, open_text(writers[1], newline="\n") as csv_file:
+        write_outputs(json_file, csv_file, records)
+
+    return [json_filepath + '.gz', csv_filepath + '.gz']
+
+
+def open_text(binary_file, newline=None):
+    return io.TextIOWrapper(io.BufferedWriter(binary_file), encoding='utf-8', newline=newline)
+
+
+def sync_files(filepaths):
+    for filepath in filepaths:
+        file_descriptor = os.open(filepath, os.O_RDONLY)
+        try:
+            os.fsync(file_descriptor)
+        finally:
+            os.close(file_descriptor)
+
+
+def measure(label, write, records, directory):
+    json_filepath = os.path.join(directory, label.replace(' ', '_') + '.json')
+    csv_filepath = os.path.join(directory, label.replace(' ', '_') + '.csv')
+
+    started_at = time.perf_counter()
+    output_paths = write(json_filepath, csv_filepath, records)
+    write_seconds = time.perf_counter() - started_at
+    sync_files(output_paths)
+    synced_seconds = time.perf_counter() - started_at
+
+    output_bytes = sum(os.path.getsize(path) for path in output_paths)
+    matches = list(read_json_records(output_paths[0])) == records \
+        and len(list(read_csv_records(output_paths[1]))) == len(records)
+
+    print('{:<22} write: {:6.3f}s  write+fsync: {:6.3f}s  size: {:7.2f} MiB  matches: {}'.format(
+        label, write_seconds, synced_seconds, output_bytes / 1024 / 1024, matches))
+
+
+def main():
+    records = generate_records(BENCHMARK_RECORD_COUNT)
+    print('Records: ' + str(len(records)) + ', cpus: ' + str(os.cpu_count()))
+
+    benchmarks = [
+        ('uncompressed', lambda json_filepath, csv_filepath, records:
+            write_with_open_output(json_filepath, csv_filepath, records, None)),
+        ('gzip.open level 9', write_with_gzip_open),
+        ('parallel gzip', lambda json_filepath, csv_filepath, records:
+            write_with_open_output(json_filepath, csv_filepath, records, COMPRESSION_GZIP)),
+        ('parallel gzip level 6', lambda json_filepath, csv_filepath, records:
+            write_with_parallel_gzip(json_filepath, csv_filepath, records, level=6)),
+    ]
+
+    try:
+        import zstandard  # noqa: F401
+        benchmarks.append(('zstd', lambda json_filepath, csv_filepath, records:
+                           write_with_open_output(json_filepath, csv_filepath, records,
+                                                  COMPRESSION_ZSTD)))
+    except ImportError:
+        print('zstandard is not installed, skipping zstd')
+
+    directory = tempfile.mkdtemp(dir='.')
+    try:
+        for label, write in benchmarks:
+            measure(label, write, records, directory)
+    finally:
+        shutil.rmtree(directory)
+
+
+main()
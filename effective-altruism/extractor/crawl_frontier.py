@@ -0,0 +1,45 @@
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+# scheme and host are case-insensitive, default ports, fragments and the order of query
+# parameters do not change the page; paths are kept as they are, cafa's dispatch is in it
+def normalize_url(url):
+    url_parts = urlsplit(url.strip())
+    scheme = url_parts.scheme.lower()
+
+    netloc = (url_parts.hostname or '').lower()
+    if url_parts.port is not None and url_parts.port != DEFAULT_PORTS.get(scheme):
+        netloc += ':' + str(url_parts.port)
+
+    query = urlencode(sorted(parse_qsl(url_parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, url_parts.path or '/', query, ''))
+
+
+# tracks the urls a crawl has already admitted
+class CrawlFrontier:
+    def __init__(self):
+        self.seen_urls = set()
+        self.duplicate_count = 0
+
+    def add(self, url):
+        return self.add_normalized(normalize_url(url))
+
+    def add_normalized(self, url):
+        if url in self.seen_urls:
+            self.duplicate_count += 1
+            return False
+
+        self.seen_urls.add(url)
+        return True
+
+    # keeps the first item of each url, paired with its normalized url
+    def admit(self, items, get_url):
+        admitted_items = []
+        for item in items:
+            url = normalize_url(get_url(item))
+            if self.add_normalized(url):
+                admitted_items.append((item, url))
+
+        return admitted_items
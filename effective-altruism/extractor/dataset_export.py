@@ -0,0 +1,134 @@
+import glob
+import hashlib
+import heapq
+import json
+import os
+import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+from compressed_output import JsonArrayWriter, get_output_path, open_output, read_json_records
+
+DATASET_OUTPUT_PATH = '../data/combined.json'
+DATASET_SHARD_COUNT = 16
+DATASET_EXPORT_WORKERS = os.cpu_count() or 1
+
+NON_WORD_RUN_PATTERN = re.compile(r"\W+")
+
+
+# the same organization is spelled with different case and punctuation across sources
+def normalize_name(name):
+    return NON_WORD_RUN_PATTERN.sub(' ', name.casefold()).strip()
+
+
+def get_shard_index(normalized_name, shard_count):
+    name_hash = hashlib.md5(normalized_name.encode('utf-8'), usedforsecurity=False).digest()
+    return int.from_bytes(name_hash[:8], 'big') % shard_count
+
+
+def generate_shard_filepath(shard_path, shard_index, source=None):
+    shard_filename = 'shard-{:03d}'.format(shard_index)
+    if source is not None:
+        shard_filename += '-' + source
+
+    return os.path.join(shard_path, shard_filename + '.jsonl')
+
+
+# every charity of a normalized name lands in the same shard, so sorting the shards one
+# by one and merging them gives a dataset sorted by name with its duplicates side by side
+def export_dataset(source_json_paths, output_path=DATASET_OUTPUT_PATH,
+                   shard_count=DATASET_SHARD_COUNT, workers=DATASET_EXPORT_WORKERS,
+                   compression=None, keep_shards=False):
+    shard_path = output_path + '.shards'
+    shutil.rmtree(shard_path, ignore_errors=True)
+    os.makedirs(shard_path)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            record_counts = list(executor.map(
+                partition_source, source_json_paths, source_json_paths.values(),
+                [shard_path] * len(source_json_paths),
+                [shard_count] * len(source_json_paths)))
+            for source, record_count in zip(source_json_paths, record_counts):
+                print('Partitioned {}: {} records'.format(source, record_count))
+
+            sorted_shard_filepaths = list(executor.map(
+                sort_shard, [shard_path] * shard_count, range(shard_count)))
+
+        record_count = merge_sorted_shards(sorted_shard_filepaths, output_path, compression)
+        print('Exported {} records to {}'.format(
+            record_count, get_output_path(output_path, compression)))
+    finally:
+        if not keep_shards:
+            shutil.rmtree(shard_path, ignore_errors=True)
+
+    return record_count
+
+
+# each source is read as a stream and appended to its own part of every shard
+def partition_source(source, json_path, shard_path, shard_count):
+    shard_files = [open(generate_shard_filepath(shard_path, shard_index, source), 'w')
+                   for shard_index in range(shard_count)]
+
+    record_count = 0
+    try:
+        for record in read_json_records(json_path):
+            normalized_name = normalize_name(record.get('name') or '')
+            shard_file = shard_files[get_shard_index(normalized_name, shard_count)]
+            shard_file.write(json.dumps([normalized_name, source, {'source': source, **record}]))
+            shard_file.write('\n')
+            record_count += 1
+    finally:
+        for shard_file in shard_files:
+            shard_file.close()
+
+    return record_count
+
+
+# a shard is sorted in memory, so the shard count bounds the memory used per worker
+def sort_shard(shard_path, shard_index):
+    shard_part_filepaths = sorted(glob.glob(
+        generate_shard_filepath(shard_path, shard_index, '*')))
+
+    shard_entries = []
+    for shard_part_filepath in shard_part_filepaths:
+        with open(shard_part_filepath) as file_in:
+            shard_entries.extend(map(json.loads, file_in))
+    shard_entries.sort(key=get_entry_sort_key)
+
+    sorted_shard_filepath = generate_shard_filepath(shard_path, shard_index)
+    with open(sorted_shard_filepath, 'w') as file_out:
+        for shard_entry in shard_entries:
+            file_out.write(json.dumps(shard_entry))
+            file_out.write('\n')
+
+    for shard_part_filepath in shard_part_filepaths:
+        os.remove(shard_part_filepath)
+
+    return sorted_shard_filepath
+
+
+def get_entry_sort_key(shard_entry):
+    normalized_name, source, record = shard_entry
+    return normalized_name, source, record.get('name') or ''
+
+
+def read_shard_entries(shard_filepath):
+    with open(shard_filepath) as file_in:
+        yield from map(json.loads, file_in)
+
+
+# only one entry per shard is held in memory while merging
+def merge_sorted_shards(sorted_shard_filepaths, output_path, compression=None):
+    shard_entries = heapq.merge(*map(read_shard_entries, sorted_shard_filepaths),
+                                key=get_entry_sort_key)
+
+    record_count = 0
+    with open_output(output_path, compression) as file_out:
+        json_array_writer = JsonArrayWriter(file_out)
+        for _, _, record in shard_entries:
+            json_array_writer.write(record)
+            record_count += 1
+        json_array_writer.close()
+
+    return record_count
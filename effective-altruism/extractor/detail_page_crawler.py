@@ -0,0 +1,109 @@
+import functools
+
+from crawl_frontier import CrawlFrontier
+from freshness_store import PAGE_MAX_AGE_SECONDS
+
+
+# fetches one detail page per charity for the extractors that list charities first and
+# read each one's page after; detail pages are fetched through the task queue, so an
+# interrupted crawl resumes from the pages it has not fetched yet, a charity listed
+# twice is kept once and pages fetched recently by an earlier run are not requested again
+class DetailPageCrawler:
+    def __init__(self, http, freshness_store, parse_cache, task_queue, generate_url,
+                 parse_page_html, workers=1, max_age_seconds=PAGE_MAX_AGE_SECONDS):
+        self.http = http
+        self.freshness_store = freshness_store
+        self.parse_cache = parse_cache
+        self.task_queue = task_queue
+        self.generate_url = generate_url
+        self.parse_page_html = parse_page_html
+        self.workers = workers
+        self.max_age_seconds = max_age_seconds
+
+    def crawl(self, charities):
+        crawl_frontier = CrawlFrontier()
+        charities_with_urls = crawl_frontier.admit(charities, self.generate_url)
+        print('Duplicate detail pages skipped: ' + str(crawl_frontier.duplicate_count))
+
+        fresh_urls = {url for _, url in charities_with_urls
+                      if self.freshness_store.is_page_fresh(url, self.max_age_seconds)}
+        print('Fresh detail pages reused: ' + str(len(fresh_urls)))
+
+        fetched_urls = [url for _, url in charities_with_urls if url not in fresh_urls]
+        self.task_queue.purge_dead_letters(fetched_urls)
+        self.task_queue.enqueue((url, url) for url in fetched_urls)
+        self.task_queue.drain(self.create_page_fetcher(), self.workers)
+        detailed_pages = self.task_queue.get_results()
+
+        return [{**charity, **self.get_details(url, url in fresh_urls, detailed_pages)}
+                for charity, url in charities_with_urls]
+
+    def get_details(self, url, is_fresh, detailed_pages):
+        if is_fresh:
+            return self.reuse_page(url)
+
+        return self.apply_page(url, detailed_pages.get(url))
+
+    # the fetcher only holds what the queue workers need, so it can be pickled for
+    # workers that are spawned rather than forked
+    def create_page_fetcher(self):
+        return functools.partial(fetch_page, self.http, self.freshness_store, self.parse_cache,
+                                 self.parse_page_html)
+
+    def apply_page(self, url, detailed_page):
+        if detailed_page is None:
+            return {}
+
+        if detailed_page['not_modified']:
+            self.freshness_store.touch_page(url)
+            return self.reuse_page(url)
+
+        self.parse_cache.put(detailed_page['body_key'], detailed_page['details'])
+        self.freshness_store.update_page(url, detailed_page['headers'], detailed_page['details'],
+                                         detailed_page['body_key'])
+        return detailed_page['details']
+
+    # the parse cache keeps the entry of a reused page, so the next time its body is
+    # sent in full it is not parsed again
+    def reuse_page(self, url):
+        body_key = self.freshness_store.get_page_body_key(url)
+        if body_key is not None:
+            self.parse_cache.mark_used(body_key)
+
+        return self.freshness_store.get_page_details(url)
+
+    # pages that could not be fetched are tried again by the next run
+    def save_freshness(self, source_fingerprint):
+        unfetched_pages = \
+            len(self.task_queue.get_dead_letters()) + self.task_queue.get_unfinished_count()
+        if unfetched_pages:
+            print('Warning: Detail pages not fetched: ' + str(unfetched_pages))
+            self.freshness_store.save()
+            return
+
+        self.freshness_store.update_fingerprint(source_fingerprint)
+
+
+# runs in the queue workers, which only read the freshness store and parse cache
+def fetch_page(http, freshness_store, parse_cache, parse_page_html, url):
+    request = http.request('GET', url, headers=freshness_store.get_conditional_headers(url))
+    if request.status == 304:
+        return {'not_modified': True}
+
+    # a page still failing after the scheduler's retries is retried by the task queue
+    if request.status != 200:
+        raise RuntimeError('Could not fetch ' + url + ': status ' + str(request.status))
+
+    # pages re-sent byte for byte are not parsed again
+    body_key = parse_cache.generate_key(request.data)
+    details = parse_cache.get(body_key)
+    if details is None:
+        details = parse_page_html(request.data.decode("UTF-8"))
+
+    return {
+        'not_modified': False,
+        'headers': {'ETag': request.headers.get('ETag'),
+                    'Last-Modified': request.headers.get('Last-Modified')},
+        'body_key': body_key,
+        'details': details,
+    }
@@ -1,38 +1,74 @@
 import csv
 import itertools
-import json
-import re
 from string import Template
 
-import urllib3
-from bs4 import BeautifulSoup
+from charity import Charity, charities_as_dicts
+from charity_store import CharityStore
+from compressed_output import open_output, write_json_records
+from detail_page_crawler import DetailPageCrawler
+from freshness_store import PAGE_MAX_AGE_SECONDS, FreshnessStore
+from parse_cache import ParseCache
+from request_scheduler import RequestScheduler
+from task_queue import TaskQueue
+from text_cleaning import replace_line_breaks
 
 EPIC_FOUNDATION_CHARITIES_URL = \
     'https://epic.foundation/inside-epic/portfolio-organizations'
 
+EPIC_FOUNDATION_SOURCE = 'epicfoundation'
+
 EPIC_FOUNDATION_CSV_DUMP_PATH = '../data/epicfoundation.csv'
 EPIC_FOUNDATION_JSON_DUMP_PATH = '../data/epicfoundation.json'
+EPIC_FOUNDATION_FRESHNESS_PATH = '../data/epicfoundation_freshness.json'
+EPIC_FOUNDATION_PARSE_CACHE_PATH = '../data/epicfoundation_parse_cache.json'
+EPIC_FOUNDATION_OUTPUT_FIELDS = ('location', 'country', 'name', 'cause_area', 'description')
 
 
 class EpicFoundationExtractor:
-    http = urllib3.PoolManager()
+    http = RequestScheduler()
+    freshness_store = FreshnessStore(EPIC_FOUNDATION_FRESHNESS_PATH)
+    parse_cache = ParseCache(EPIC_FOUNDATION_PARSE_CACHE_PATH)
+    charity_store = CharityStore()
+    output_compression = None
+    json_dump_path = EPIC_FOUNDATION_JSON_DUMP_PATH
+    csv_dump_path = EPIC_FOUNDATION_CSV_DUMP_PATH
+    task_queue = TaskQueue(EPIC_FOUNDATION_SOURCE)
+    detail_workers = 1
+    detail_page_max_age_seconds = PAGE_MAX_AGE_SECONDS
 
     def do_scrape(self):
         charities = self.get_charities()
-        charities_with_details = self.get_charities_detailed(charities)
 
-        charities_column_names_standardized = self.convert_to_standardized_columns(
-            charities_with_details)
+        source_fingerprint = self.freshness_store.generate_fingerprint(
+            [charity['data-link'] for charity in charities])
+        if self.freshness_store.is_unchanged(
+                source_fingerprint, [self.json_dump_path, self.csv_dump_path]):
+            print('Source unchanged, reusing ' + self.json_dump_path)
+            return
+
+        detail_page_crawler = self.create_detail_page_crawler()
+        charities_with_details = detail_page_crawler.crawl(charities)
+
+        charities_standardized = self.convert_to_standardized_columns(charities_with_details)
+        charities_column_names_standardized = charities_as_dicts(
+            charities_standardized, EPIC_FOUNDATION_OUTPUT_FIELDS)
 
-        self.write_list_as_json_to_file(EPIC_FOUNDATION_JSON_DUMP_PATH,
+        self.write_list_as_json_to_file(self.json_dump_path,
                                         charities_column_names_standardized)
-        self.write_list_as_csv_to_file(EPIC_FOUNDATION_CSV_DUMP_PATH,
+        self.write_list_as_csv_to_file(self.csv_dump_path,
                                        charities_column_names_standardized)
 
+        self.charity_store.write_charities(EPIC_FOUNDATION_SOURCE, charities_standardized)
+        self.parse_cache.save()
+        detail_page_crawler.save_freshness(source_fingerprint)
+        self.task_queue.clear_done()
+
     def get_charities(self):
         request = self.http.request('GET', EPIC_FOUNDATION_CHARITIES_URL)
         request_html_body = request.data.decode("UTF-8")
 
+        from bs4 import BeautifulSoup
+
         soup = BeautifulSoup(request_html_body, 'html.parser')
 
         charities_container = soup.find("div", class_="org-browser")
@@ -44,20 +80,16 @@ class EpicFoundationExtractor:
 
         return charities
 
-    def get_charities_detailed(self, charities):
-        return [{**charity, **self.get_charity_detailed_page(charity)}
-                for charity in charities]
-
-    def get_charity_detailed_page(self, charity):
-        charity_data_link = charity['data-link']
-        charity_detailed_page_url = self.generate_charity_details_url(charity_data_link)
-
-        request = self.http.request('GET', charity_detailed_page_url)
-        request_html_body = request.data.decode("UTF-8")
-
-        return self.get_charity_details_from_page_html(request_html_body)
+    def create_detail_page_crawler(self):
+        return DetailPageCrawler(
+            self.http, self.freshness_store, self.parse_cache, self.task_queue,
+            lambda charity: self.generate_charity_details_url(charity['data-link']),
+            self.get_charity_details_from_page_html, self.detail_workers,
+            self.detail_page_max_age_seconds)
 
     def get_charity_details_from_page_html(self, request_html_body):
+        from bs4 import BeautifulSoup
+
         soup = BeautifulSoup(request_html_body, 'html.parser')
 
         charity_details = {
@@ -73,28 +105,22 @@ class EpicFoundationExtractor:
         return charity_details
 
     def convert_to_standardized_columns(self, charities):
-        columns_to_keep = ["location", "country", "name", "cause_area", "description"]
-
-        for charity in charities:
-            charity['location'] = charity.get('org-location', '')
-            charity['country'] = charity.get('org-country', '')
-            charity['name'] = charity.get('org-name', '')
-            charity['cause_area'] = charity.get('fact-Sectors', '')
-
-            challenge_descriptions = charity.get('challenge-description', ' ')
-            challenge_description \
-                = self.convert_challenge_descriptions_to_string(challenge_descriptions)
-
-            charity['description'] \
-                = charity.get('org-intro', ' ') + "; " \
-                  + charity.get('org-quote', ' ') + "; " \
-                  + challenge_description
-
-            for column_name in list(charity.keys()):
-                if column_name not in columns_to_keep:
-                    del charity[column_name]
-
-        return charities
+        return [self.convert_to_standardized_charity(charity) for charity in charities]
+
+    def convert_to_standardized_charity(self, charity):
+        challenge_descriptions = charity.get('challenge-description', ' ')
+        challenge_description \
+            = self.convert_challenge_descriptions_to_string(challenge_descriptions)
+
+        return Charity(
+            source_key=charity['data-link'],
+            location=charity.get('org-location', ''),
+            country=charity.get('org-country', ''),
+            name=charity.get('org-name', ''),
+            cause_area=charity.get('fact-Sectors', ''),
+            description=charity.get('org-intro', ' ') + "; "
+                        + charity.get('org-quote', ' ') + "; "
+                        + challenge_description)
 
     @staticmethod
     def get_country_and_location(soup):
@@ -114,7 +140,7 @@ class EpicFoundationExtractor:
 
         quote_element = org_presentation_element.find('span', {"lang": "en"})
         quote = quote_element.text
-        quote = re.sub("[\r\n]", " ", quote)
+        quote = replace_line_breaks(quote)
         return {'org-quote': quote}
 
     @staticmethod
@@ -125,7 +151,7 @@ class EpicFoundationExtractor:
 
         p_elements = org_intro_element.find_all('p', {"lang": "en"})
         org_intro = " ".join([p.string for p in p_elements])
-        org_intro = re.sub("[\r\n]", " ", org_intro)
+        org_intro = replace_line_breaks(org_intro)
 
         return {'org-intro': org_intro}
 
@@ -145,7 +171,7 @@ class EpicFoundationExtractor:
             facts.append(fact_string)
 
         facts_string = "; ".join(facts)
-        facts_string = re.sub("[\r\n]", " ", facts_string)
+        facts_string = replace_line_breaks(facts_string)
 
         return {'challenge-description': facts_string}
 
@@ -192,7 +218,7 @@ class EpicFoundationExtractor:
             paragraphs = program_element.find_all('p', {"lang": "en"})
             program_text = " ".join([p.text for p in paragraphs
                                      if len(p.text) > 0])
-            program_text = re.sub("[\r\n]", " ", program_text)
+            program_text = replace_line_breaks(program_text)
 
             programs.append({program_header_text: program_text})
 
@@ -220,13 +246,12 @@ class EpicFoundationExtractor:
         keys_flattened = list(itertools.chain.from_iterable(list_of_dicts))
         return set(keys_flattened)
 
-    @staticmethod
-    def write_list_as_json_to_file(filepath, list_of_dicts):
-        with open(filepath, 'w') as file_out:
-            json.dump(list_of_dicts, file_out)
+    def write_list_as_json_to_file(self, filepath, list_of_dicts):
+        with open_output(filepath, self.output_compression) as file_out:
+            write_json_records(file_out, list_of_dicts)
 
     def write_list_as_csv_to_file(self, filepath, list_of_dicts):
-        with open(filepath, mode='w', newline="\n") as csv_file:
+        with open_output(filepath, self.output_compression, newline="\n") as csv_file:
             fieldnames = self.get_all_possible_fieldnames(list_of_dicts)
             csv_file_writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
 
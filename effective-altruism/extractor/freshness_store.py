@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import time
+
+from compressed_output import find_output_path
+
+# detail pages fetched or revalidated more recently than this are not requested again
+PAGE_MAX_AGE_SECONDS = 24 * 60 * 60
+# most fingerprints only cover a sample of the source, e.g. its count and first page, so
+# edits further in are picked up by scraping the source again once this old
+SOURCE_MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+
+
+class FreshnessStore:
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.state = None
+        self.visited_urls = set()
+
+    def get_state(self):
+        if self.state is None:
+            self.state = self.load_state(self.filepath)
+
+        return self.state
+
+    @staticmethod
+    def load_state(filepath):
+        if not os.path.exists(filepath):
+            return {'fingerprint': None, 'pages': {}}
+
+        with open(filepath) as file_in:
+            return json.load(file_in)
+
+    def save(self):
+        if self.state is None:
+            return
+
+        temporary_filepath = self.filepath + '.tmp'
+        with open(temporary_filepath, 'w') as file_out:
+            json.dump(self.state, file_out)
+        os.replace(temporary_filepath, self.filepath)
+
+    @staticmethod
+    def generate_fingerprint(*components):
+        components_json = json.dumps(components, sort_keys=True)
+        return hashlib.sha1(components_json.encode('utf-8')).hexdigest()
+
+    # a source is only skipped if its previous output, compressed or not, is still there to reuse
+    def is_unchanged(self, fingerprint, output_paths, max_age_seconds=SOURCE_MAX_AGE_SECONDS):
+        state = self.get_state()
+        if state['fingerprint'] != fingerprint:
+            return False
+        if time.time() - state.get('fingerprinted_at', 0) >= max_age_seconds:
+            return False
+
+        return all(find_output_path(path) is not None for path in output_paths)
+
+    def update_fingerprint(self, fingerprint):
+        state = self.get_state()
+        state['fingerprint'] = fingerprint
+        state['fingerprinted_at'] = time.time()
+        state['pages'] = {url: page for url, page in state['pages'].items()
+                          if url in self.visited_urls}
+        self.save()
+
+    def get_conditional_headers(self, url):
+        page = self.get_state()['pages'].get(url)
+        if page is None:
+            return {}
+
+        headers = {}
+        if page['etag'] is not None:
+            headers['If-None-Match'] = page['etag']
+        if page['last_modified'] is not None:
+            headers['If-Modified-Since'] = page['last_modified']
+
+        return headers
+
+    # pages saved before fetch times were recorded are never fresh
+    def is_page_fresh(self, url, max_age_seconds=PAGE_MAX_AGE_SECONDS):
+        page = self.get_state()['pages'].get(url)
+        if page is None or page.get('fetched_at') is None:
+            return False
+
+        return time.time() - page['fetched_at'] < max_age_seconds
+
+    # a 304 confirms the saved details as of now
+    def touch_page(self, url):
+        self.get_state()['pages'][url]['fetched_at'] = time.time()
+
+    def get_page_details(self, url):
+        self.visited_urls.add(url)
+        return self.get_state()['pages'][url]['details']
+
+    def get_page_body_key(self, url):
+        return self.get_state()['pages'][url].get('body_key')
+
+    def update_page(self, url, response_headers, details, body_key=None):
+        self.visited_urls.add(url)
+        self.get_state()['pages'][url] = {
+            'etag': response_headers.get('ETag'),
+            'last_modified': response_headers.get('Last-Modified'),
+            'details': details,
+            'body_key': body_key,
+            'fetched_at': time.time(),
+        }
@@ -2,33 +2,61 @@ import csv
 import itertools
 import json
 
-import urllib3
-from bs4 import BeautifulSoup
+from charity import Charity, charities_as_dicts
+from charity_store import CharityStore
+from compressed_output import open_output, write_json_records
+from freshness_store import FreshnessStore
+from request_scheduler import RequestScheduler
 
 GLOGALGIVING_SEARCH_URL = 'https://www.globalgiving.org/search/'
 GLOBALGIVING_API_URL = \
     'https://www.globalgiving.org/dy/v2/search/query'
 
+GLOBALGIVING_SOURCE = 'globalgiving'
+
 GLOBALGIVING_CSV_DUMP_PATH = '../data/globalgiving.csv'
 GLOBALGIVING_JSON_DUMP_PATH = '../data/globalgiving.json'
+GLOBALGIVING_FRESHNESS_PATH = '../data/globalgiving_freshness.json'
+GLOBALGIVING_OUTPUT_FIELDS = ('name', 'country', 'description', 'cause_area')
 
 
 class GlobalGivingExtractor:
-    http = urllib3.PoolManager()
+    http = RequestScheduler()
+    freshness_store = FreshnessStore(GLOBALGIVING_FRESHNESS_PATH)
+    charity_store = CharityStore()
+    output_compression = None
+    json_dump_path = GLOBALGIVING_JSON_DUMP_PATH
+    csv_dump_path = GLOBALGIVING_CSV_DUMP_PATH
 
     def do_scrape(self):
+        source_fingerprint = self.get_source_fingerprint()
+        if self.freshness_store.is_unchanged(
+                source_fingerprint, [self.json_dump_path, self.csv_dump_path]):
+            print('Source unchanged, reusing ' + self.json_dump_path)
+            return
+
         charities = self.get_charities()
 
         charities_column_names_standardized = self.convert_to_standardized_columns(
             charities)
-        charities_with_merged_programs = \
-            self.merge_programs_from_common_charities(charities_column_names_standardized)
+        charities_merged = self.merge_programs_from_common_charities(
+            charities_column_names_standardized)
+        charities_with_merged_programs = charities_as_dicts(
+            charities_merged, GLOBALGIVING_OUTPUT_FIELDS)
 
-        self.write_list_as_json_to_file(GLOBALGIVING_JSON_DUMP_PATH,
+        self.write_list_as_json_to_file(self.json_dump_path,
                                         charities_with_merged_programs)
-        self.write_list_as_csv_to_file(GLOBALGIVING_CSV_DUMP_PATH,
+        self.write_list_as_csv_to_file(self.csv_dump_path,
                                        charities_with_merged_programs)
 
+        self.charity_store.write_charities(GLOBALGIVING_SOURCE, charities_merged)
+        self.freshness_store.update_fingerprint(source_fingerprint)
+
+    def get_source_fingerprint(self):
+        request_json = self.get_charities_json_from_api(1)
+        return self.freshness_store.generate_fingerprint(
+            request_json['hits']['total'], request_json['hits']['hits'])
+
     def get_charities(self):
         number_of_charities = self.get_number_of_charities()
 
@@ -55,6 +83,8 @@ class GlobalGivingExtractor:
         request = self.http.request('POST', GLOGALGIVING_SEARCH_URL)
         request_html_body = request.data.decode("UTF-8")
 
+        from bs4 import BeautifulSoup
+
         soup = BeautifulSoup(request_html_body, 'html.parser')
 
         filter_tabs = soup.find_all("div", class_="grid-parent box_horizontalPadded1 box_padded2 "
@@ -81,30 +111,22 @@ class GlobalGivingExtractor:
 
     def convert_to_standardized_columns(self, charities):
         cause_area_converter = self.get_cause_area_converter()
-        columns_to_keep = ["name", "cause_area", "country", "description"]
 
-        for charity in charities:
-            charity['name'] = charity.get('orgname', '')
-            charity['country'] = charity.get('countryname', '')
-            charity['description'] \
-                = charity.get('projtitle', '') + ": " + charity.get('projsummary', '')
-
-            cause_areas = charity.get('allthemes', [])
-            cause_areas = [cause_area_converter[cause_area] for cause_area in cause_areas]
-            charity['cause_area'] = ", ".join(cause_areas)
-
-            for column_name in list(charity.keys()):
-                if column_name not in columns_to_keep:
-                    del charity[column_name]
-
-        return charities
+        return [
+            Charity(
+                name=charity.get('orgname', ''),
+                country=charity.get('countryname', ''),
+                description=charity.get('projtitle', '') + ": " + charity.get('projsummary', ''),
+                cause_area=", ".join([cause_area_converter[cause_area]
+                                      for cause_area in charity.get('allthemes', [])]))
+            for charity in charities]
 
     @staticmethod
     def merge_programs_from_common_charities(charities_column_names_standardized):
         charities_merged = {}
 
         for charity in charities_column_names_standardized:
-            charity_name = charity['name']
+            charity_name = charity.name
 
             if charity_name not in charities_merged:
                 charities_merged[charity_name] = charity
@@ -112,12 +134,12 @@ class GlobalGivingExtractor:
 
             existing_charity = charities_merged[charity_name]
 
-            merged_charity = {
-                'name': existing_charity['name'],
-                'country': existing_charity['country'] + ", " + charity['country'],
-                'description': existing_charity['description'] + ", " + charity['description'],
-                'cause_area': existing_charity['cause_area'] + ", " + charity['cause_area'],
-            }
+            merged_charity = Charity(
+                name=existing_charity.name,
+                country=existing_charity.country + ", " + charity.country,
+                description=existing_charity.description + ", " + charity.description,
+                cause_area=existing_charity.cause_area + ", " + charity.cause_area,
+            )
 
             charities_merged[charity_name] = merged_charity
 
@@ -128,13 +150,12 @@ class GlobalGivingExtractor:
         keys_flattened = list(itertools.chain.from_iterable(list_of_dicts))
         return set(keys_flattened)
 
-    @staticmethod
-    def write_list_as_json_to_file(filepath, list_of_dicts):
-        with open(filepath, 'w') as file_out:
-            json.dump(list_of_dicts, file_out)
+    def write_list_as_json_to_file(self, filepath, list_of_dicts):
+        with open_output(filepath, self.output_compression) as file_out:
+            write_json_records(file_out, list_of_dicts)
 
     def write_list_as_csv_to_file(self, filepath, list_of_dicts):
-        with open(filepath, mode='w', newline="\n") as csv_file:
+        with open_output(filepath, self.output_compression, newline="\n") as csv_file:
             fieldnames = self.get_all_possible_fieldnames(list_of_dicts)
             csv_file_writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
 
@@ -1,69 +1,90 @@
 import csv
-import json
 import re
 
-from PyPDF2 import PdfFileReader
+from charity import Charity
+from charity_store import CharityStore
+from compressed_output import JsonArrayWriter, open_output
+from pdf_access import MappedPdf
 
 # original source:
 # http://www.oilseedcrops.org/wp-content/uploads/2013/07/Myanmar-Local-NGO-directory-2012.pdf
 OILSEEDCROPS_PDF_PATH = '../data/Myanmar-Local-NGO-directory-2012.pdf'
 
+OILSEEDCROPS_SOURCE = 'oilseedcrops'
+
 CHARITIES_JSON_DUMP_PATH = '../data/oilseedcrops.json'
 CHARITIES_CSV_DUMP_PATH = '../data/oilseedcrops.csv'
+CHARITIES_OUTPUT_FIELDS = ('name', 'country', 'description', 'address')
+
+INDEX_PAGE_SEARCH_LIMIT = 20
+INDEX_PAGE_MIN_ENTRIES = 3
+# the 2012 directory's index is on pages 1-3, so its organization pages are offset by 3
+KNOWN_INDEX_PAGE_NUMBERS = [1, 2, 3]
+
+PAGE_NUMBER_LINE_PATTERN = re.compile(r"\n[ ]*([0-9]+-?[0-9]*)\n")
+ORGANIZATION_ENTRY_PATTERN = re.compile(r"^\d*?\..*$")
+ORGANIZATION_LINE_PATTERN = re.compile(r"^[0-9]+?\. (.*?)[ ]*?([0-9]+-?[0-9]*).*?$")
+# headers that only organization pages have
+ORGANIZATION_SECTION_PATTERN = re.compile(r"Vision/Mission|Name of Leader")
+
+BACKGROUND_PATTERN = re.compile(r"(?<=Background)(.+?)(?=Vision/Mission)")
+VISION_MISSION_PATTERN = re.compile(r"(?<=Vision/Mission)(.+?)(?=Main Activities)")
+MAIN_ACTIVITIES_PATTERN = re.compile(r"(?<=Main Activities)(.+?)(?=Primary BeneÞ  ciaries)")
+PRIMARY_BENEFICIARIES_PATTERN \
+    = re.compile(r"(?<=Primary BeneÞ  ciaries)(.+?)(?=Name of Leader)")
+PARENTHESIZED_TEXT_PATTERN = re.compile(r"\(.+?\)")
 
 
 class OilSeedCropsExtractor:
+    charity_store = CharityStore()
+    output_compression = None
+    json_dump_path = CHARITIES_JSON_DUMP_PATH
+    csv_dump_path = CHARITIES_CSV_DUMP_PATH
+
     def do_extract(self):
-        pdf = PdfFileReader(open(OILSEEDCROPS_PDF_PATH, "rb"))
+        with MappedPdf(OILSEEDCROPS_PDF_PATH) as pdf:
+            organization_entities = self.get_organizations_from_index_pages(pdf)
 
-        organization_entities = self.get_organizations_from_index_pages(pdf)
-        for organization_name, organization in organization_entities.items():
-            organization['raw_text'] = self.get_organization_raw_text(pdf, organization)
-        for organization_name, organization in organization_entities.items():
-            organization.update(self.get_organization_details(organization))
+            charities = (self.extract_charity(pdf, organization)
+                         for organization in organization_entities.values())
 
-        charities_columns_standardized \
-            = self.convert_to_standardized_columns(list(organization_entities.values()))
+            self.charity_store.write_charities(
+                OILSEEDCROPS_SOURCE,
+                self.stream_charities_to_files(
+                    self.json_dump_path, self.csv_dump_path, charities))
 
-        self.write_list_as_json_to_file(
-            CHARITIES_JSON_DUMP_PATH, charities_columns_standardized)
-        self.write_list_as_csv_to_file(
-            CHARITIES_CSV_DUMP_PATH, charities_columns_standardized)
+    # one organization's text is alive at a time, from page extraction to the writers
+    def extract_charity(self, pdf, organization):
+        organization_details = self.get_organization_details({
+            'name': organization['name'],
+            'raw_text': self.get_organization_raw_text(pdf, organization),
+        })
 
-        pass
+        return self.convert_to_standardized_charity(
+            {'name': organization['name'], **organization_details})
 
     @staticmethod
     def get_organization_details(organization):
         organization_raw_text_list = organization['raw_text']
         organization_name = organization['name']
 
-        background_matcher \
-            = re.compile(r"(?<=Background)(.+?)(?=Vision/Mission)")
-        vision_mission_matcher \
-            = re.compile(r"(?<=Vision/Mission)(.+?)(?=Main Activities)")
-        main_activities_matcher \
-            = re.compile(r"(?<=Main Activities)(.+?)(?=Primary BeneÞ  ciaries)")
-        primary_beneficiaries_matcher \
-            = re.compile(r"(?<=Primary BeneÞ  ciaries)(.+?)(?=Name of Leader)")
-
-        organization_name_special_escaped = re.sub("\(.+?\)", "", organization_name).strip()
+        organization_name_special_escaped \
+            = PARENTHESIZED_TEXT_PATTERN.sub("", organization_name).strip()
         organization_info_matcher \
             = re.compile(organization_name_special_escaped + "(.+?)(?=Name of Leader)")
 
-        organization_full_text = ""
-        for text in organization_raw_text_list:
-            organization_full_text = organization_full_text + " " + text
+        organization_full_text = " " + " ".join(organization_raw_text_list)
         organization_full_text = organization_full_text.replace("\n", " ")
 
         organization_info = organization_info_matcher.search(organization_full_text)
         if organization_info is not None:
             organization_full_text = organization_full_text.replace(organization_info.group(0), " ")
 
-        background_info = background_matcher.search(organization_full_text)
-        vision_mission_info = vision_mission_matcher.search(organization_full_text)
-        main_activities_info = main_activities_matcher.search(organization_full_text)
+        background_info = BACKGROUND_PATTERN.search(organization_full_text)
+        vision_mission_info = VISION_MISSION_PATTERN.search(organization_full_text)
+        main_activities_info = MAIN_ACTIVITIES_PATTERN.search(organization_full_text)
         primary_beneficiaries_info \
-            = primary_beneficiaries_matcher.search(organization_full_text)
+            = PRIMARY_BENEFICIARIES_PATTERN.search(organization_full_text)
 
         def get_matcher_result_or_blank(match):
             if match is None:
@@ -85,93 +106,124 @@ class OilSeedCropsExtractor:
     def get_organization_raw_text(pdf, organization):
         organization_page_numbers = range(organization['start_page'], organization['end_page'] + 1)
         organization_unmerged_raw_text = \
-            [pdf.getPage(number).extractText() for number in organization_page_numbers]
+            [pdf.get_page_text(number) for number in organization_page_numbers]
 
         return organization_unmerged_raw_text
 
-    @staticmethod
-    def get_organizations_from_index_pages(pdf):
-        PAGE_OFFSET = 3
+    def get_organizations_from_index_pages(self, pdf):
+        index_page_numbers, index_pages_raw_text = self.find_index_pages(pdf)
+        if index_page_numbers != KNOWN_INDEX_PAGE_NUMBERS:
+            print('Warning: Index pages found at {}, the 2012 directory has them at {}'.format(
+                index_page_numbers, KNOWN_INDEX_PAGE_NUMBERS))
 
-        index_pages = [pdf.getPage(1), pdf.getPage(2), pdf.getPage(3)]
+        # organization pages are numbered from the first page after the index
+        page_offset = index_page_numbers[-1]
 
-        index_pages_raw_text = ""
-        for page in index_pages:
-            index_pages_raw_text = index_pages_raw_text + "\n" + page.extractText()
-        index_pages_raw_text = index_pages_raw_text.replace("\n\n", "\n")
+        organizations = {}
+        for line in self.collapse_page_numbers(index_pages_raw_text).split("\n"):
+            organization = self.get_organization_from_index_line(line, page_offset)
+            if organization is not None:
+                organizations[organization['name']] = organization
 
-        def collapse_page_numbers(raw_text):
-            collapse_page_numbers_matcher = re.compile(r"\n[ ]*?[0-9]+?-?[0-9]*?\n")
-
-            cleaned_text = raw_text
-            for matched_page_number in collapse_page_numbers_matcher.findall(raw_text):
-                cleaned_text = cleaned_text.replace(matched_page_number,
-                                                    matched_page_number.strip() + "\n")
-
-            return cleaned_text
-
-        index_pages_collapsed_page_numbers = collapse_page_numbers(index_pages_raw_text)
-
-        organization_entry_matcher = re.compile(r"^\d*?\..*$", re.MULTILINE)
-        organization_entries_uncleaned = \
-            [line for line in index_pages_collapsed_page_numbers.split("\n")
-             if organization_entry_matcher.match(line)]
-
-        def get_organization(raw_organization_line):
-            organization_line_matcher \
-                = re.compile(r"^[0-9]+?. (.*?)[ ]*?([0-9]+-?[0-9]*).*?$")
-            matcher = organization_line_matcher.match(raw_organization_line)
-
-            pages_component = matcher.group(2)
-            if "-" in pages_component:
-                start_page = pages_component.split("-")[0]
-                end_page = pages_component.split("-")[1]
-            else:
-                start_page = pages_component
-                end_page = pages_component
-
-            return {
-                'name': matcher.group(1).strip(),
-                'start_page': PAGE_OFFSET + int(start_page),
-                'end_page': PAGE_OFFSET + int(end_page),
-            }
-
-        organizations_list = \
-            [get_organization(name) for name in organization_entries_uncleaned]
-        organizations = {value['name']: value for value in organizations_list}
         return organizations
 
-    @staticmethod
-    def convert_to_standardized_columns(charities):
-        columns_to_remove = ["start_page", "end_page", "raw_text"]
+    # the index ends at the first page with organization sections or with entries that
+    # do not continue it, e.g. numbered body text like "1. Train 200 farmers"
+    def find_index_pages(self, pdf):
+        index_page_numbers = []
+        index_pages_text = []
+        last_start_page = 0
+
+        number_of_pages = pdf.get_number_of_pages()
+        for page_number in range(1, min(INDEX_PAGE_SEARCH_LIMIT, number_of_pages)):
+            page_text = pdf.get_page_text(page_number)
+            if index_page_numbers and ORGANIZATION_SECTION_PATTERN.search(page_text):
+                break
+
+            minimum_entries = INDEX_PAGE_MIN_ENTRIES if not index_page_numbers else 1
+            entries = self.get_index_entries(page_text)
+
+            if len(entries) >= minimum_entries and self.continues_index(
+                    entries, last_start_page, number_of_pages - page_number):
+                index_page_numbers.append(page_number)
+                index_pages_text.append(page_text)
+                last_start_page = entries[-1]['start_page']
+            elif index_page_numbers:
+                break
+
+        if not index_page_numbers:
+            raise ValueError('No index pages found in ' + OILSEEDCROPS_PDF_PATH)
+
+        index_pages_raw_text = "\n" + "\n".join(index_pages_text)
+        index_pages_raw_text = index_pages_raw_text.replace("\n\n", "\n")
+
+        return index_page_numbers, index_pages_raw_text
 
-        for charity in charities:
-            charity['description'] = \
-                charity.pop('background') + " " + \
-                charity.pop('vision_mission') + " " + \
-                charity.pop('main_activities') + " " + \
-                charity.pop('primary_beneficiaries')
-            charity['address'] = charity.pop('organization_info')
+    def get_index_entries(self, page_text):
+        page_raw_text = ("\n" + page_text).replace("\n\n", "\n")
+        entries = [self.get_organization_from_index_line(line, 0)
+                   for line in self.collapse_page_numbers(page_raw_text).split("\n")]
 
-            for column_name_to_remove in columns_to_remove:
-                del charity[column_name_to_remove]
+        return [entry for entry in entries if entry is not None]
+
+    # index entries are in page order and point at pages after the index
+    @staticmethod
+    def continues_index(entries, last_start_page, pages_after_index):
+        start_pages = [entry['start_page'] for entry in entries]
 
-        return charities
+        return start_pages == sorted(start_pages) and start_pages[0] >= last_start_page \
+            and all(entry['start_page'] <= entry['end_page'] <= pages_after_index
+                    for entry in entries)
 
     @staticmethod
-    def write_list_as_json_to_file(filepath, list_of_dicts):
-        with open(filepath, 'w') as file_out:
-            json.dump(list_of_dicts, file_out)
+    def collapse_page_numbers(raw_text):
+        return PAGE_NUMBER_LINE_PATTERN.sub(r"\1\n", raw_text)
 
     @staticmethod
-    def write_list_as_csv_to_file(filepath, list_of_dicts):
-        with open(filepath, mode='w', newline="\n") as csv_file:
-            fieldnames = list_of_dicts[0].keys()
-            csv_file_writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+    def get_organization_from_index_line(line, page_offset):
+        if not ORGANIZATION_ENTRY_PATTERN.match(line):
+            return None
 
-            csv_file_writer.writeheader()
-            for charity in list_of_dicts:
-                csv_file_writer.writerow(charity)
+        matcher = ORGANIZATION_LINE_PATTERN.match(line)
+        if matcher is None:
+            return None
 
+        start_page, _, end_page = matcher.group(2).partition("-")
 
-OilSeedCropsExtractor().do_extract()
+        return {
+            'name': matcher.group(1).strip(),
+            'start_page': page_offset + int(start_page),
+            'end_page': page_offset + int(end_page or start_page),
+        }
+
+    @staticmethod
+    def convert_to_standardized_charity(charity):
+        return Charity(
+            name=charity['name'],
+            country=charity['country'],
+            description=charity['background'] + " " +
+                        charity['vision_mission'] + " " +
+                        charity['main_activities'] + " " +
+                        charity['primary_beneficiaries'],
+            address=charity['organization_info'])
+
+    # the csv header comes from the first charity; every charity is passed on once it
+    # is written, so the store can consume the same stream
+    def stream_charities_to_files(self, json_filepath, csv_filepath, charities):
+        with open_output(json_filepath, self.output_compression) as json_file, \
+                open_output(csv_filepath, self.output_compression, newline="\n") as csv_file:
+            json_array_writer = JsonArrayWriter(json_file)
+            csv_file_writer = None
+
+            for charity in charities:
+                charity_dict = charity.as_dict(CHARITIES_OUTPUT_FIELDS)
+
+                if csv_file_writer is None:
+                    csv_file_writer = csv.DictWriter(csv_file, fieldnames=charity_dict.keys())
+                    csv_file_writer.writeheader()
+
+                json_array_writer.write(charity_dict)
+                csv_file_writer.writerow(charity_dict)
+
+                yield charity
+            json_array_writer.close()
@@ -0,0 +1,8 @@
+from oilseedcrops_extractor import OilSeedCropsExtractor
+
+
+def main():
+    OilSeedCropsExtractor().do_extract()
+
+
+main()
@@ -2,31 +2,57 @@ import csv
 import itertools
 import json
 import math
-import re
 
-import urllib3
+from charity import Charity, charities_as_dicts
+from charity_store import CharityStore
+from compressed_output import open_output, write_json_records
+from freshness_store import FreshnessStore
+from request_scheduler import RequestScheduler
+from text_cleaning import replace_control_whitespace
 
 ONEWORLD365_API_URL = 'http://api.oneworld365.org/search/volunteer'
 ONEWORLD365_API_MAX_PAGINATION_SIZE = 999
 
+ONEWORLD365_SOURCE = 'oneworld365'
+
 ONEWORLD365_CSV_DUMP_PATH = '../data/oneworld365.csv'
 ONEWORLD365_JSON_DUMP_PATH = '../data/oneworld365.json'
+ONEWORLD365_FRESHNESS_PATH = '../data/oneworld365_freshness.json'
 
 
 class OneWorld365Extractor:
-    http = urllib3.PoolManager()
+    http = RequestScheduler()
+    freshness_store = FreshnessStore(ONEWORLD365_FRESHNESS_PATH)
+    charity_store = CharityStore()
+    output_compression = None
+    json_dump_path = ONEWORLD365_JSON_DUMP_PATH
+    csv_dump_path = ONEWORLD365_CSV_DUMP_PATH
 
     def do_scrape(self):
+        source_fingerprint = self.get_source_fingerprint()
+        if self.freshness_store.is_unchanged(
+                source_fingerprint, [self.json_dump_path, self.csv_dump_path]):
+            print('Source unchanged, reusing ' + self.json_dump_path)
+            return
+
         charities = self.get_charities()
 
-        charities_column_names_standardized = self.convert_to_standardized_columns(
-            charities)
+        charities_standardized = self.convert_to_standardized_columns(charities)
+        charities_column_names_standardized = charities_as_dicts(charities_standardized)
 
-        self.write_list_as_json_to_file(ONEWORLD365_JSON_DUMP_PATH,
+        self.write_list_as_json_to_file(self.json_dump_path,
                                         charities_column_names_standardized)
-        self.write_list_as_csv_to_file(ONEWORLD365_CSV_DUMP_PATH,
+        self.write_list_as_csv_to_file(self.csv_dump_path,
                                        charities_column_names_standardized)
 
+        self.charity_store.write_charities(ONEWORLD365_SOURCE, charities_standardized)
+        self.freshness_store.update_fingerprint(source_fingerprint)
+
+    def get_source_fingerprint(self):
+        request_json = self.call_charities_api(0, 1)
+        return self.freshness_store.generate_fingerprint(
+            request_json['total_results'], request_json['data']['profile'])
+
     def get_charities(self):
         number_of_charities = self.get_number_of_charities()
 
@@ -73,31 +99,24 @@ class OneWorld365Extractor:
 
     @staticmethod
     def convert_to_standardized_columns(charities):
-        columns_to_keep = ["name", "description"]
-
-        for charity in charities:
-            charity['name'] = charity.get('title', '')
-            charity['website'] = charity.get('profile_url', '')
-            charity['description'] = re.sub("[\n\r\t]", " ", charity.get('desc_short', ''))
-
-            for column_name in list(charity.keys()):
-                if column_name not in columns_to_keep:
-                    del charity[column_name]
-
-        return charities
+        return [
+            Charity(
+                source_key=charity.get('profile_url', ''),
+                name=charity.get('title', ''),
+                description=replace_control_whitespace(charity.get('desc_short', '')))
+            for charity in charities]
 
     @staticmethod
     def get_all_possible_fieldnames(list_of_dicts):
         keys_flattened = list(itertools.chain.from_iterable(list_of_dicts))
         return set(keys_flattened)
 
-    @staticmethod
-    def write_list_as_json_to_file(filepath, list_of_dicts):
-        with open(filepath, 'w') as file_out:
-            json.dump(list_of_dicts, file_out)
+    def write_list_as_json_to_file(self, filepath, list_of_dicts):
+        with open_output(filepath, self.output_compression) as file_out:
+            write_json_records(file_out, list_of_dicts)
 
     def write_list_as_csv_to_file(self, filepath, list_of_dicts):
-        with open(filepath, mode='w', newline="\n") as csv_file:
+        with open_output(filepath, self.output_compression, newline="\n") as csv_file:
             fieldnames = self.get_all_possible_fieldnames(list_of_dicts)
             csv_file_writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
 
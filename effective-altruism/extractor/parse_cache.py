@@ -0,0 +1,56 @@
+import hashlib
+import json
+import os
+
+
+class ParseCache:
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.entries = None
+        self.used_keys = set()
+
+    def get_entries(self):
+        if self.entries is None:
+            self.entries = self.load_entries(self.filepath)
+
+        return self.entries
+
+    @staticmethod
+    def load_entries(filepath):
+        if not os.path.exists(filepath):
+            return {}
+
+        with open(filepath) as file_in:
+            return json.load(file_in)
+
+    @staticmethod
+    def generate_key(body):
+        return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+    def get(self, key):
+        parsed = self.get_entries().get(key)
+        if parsed is not None:
+            self.used_keys.add(key)
+
+        return parsed
+
+    # keeps the entry of a page whose parsed details were reused without its body
+    def mark_used(self, key):
+        self.used_keys.add(key)
+
+    def put(self, key, parsed):
+        self.get_entries()[key] = parsed
+        self.used_keys.add(key)
+
+    # entries for pages that were not seen in this run are dropped
+    def save(self):
+        if self.entries is None:
+            return
+
+        self.entries = {key: parsed for key, parsed in self.entries.items()
+                        if key in self.used_keys}
+
+        temporary_filepath = self.filepath + '.tmp'
+        with open(temporary_filepath, 'w') as file_out:
+            json.dump(self.entries, file_out)
+        os.replace(temporary_filepath, self.filepath)
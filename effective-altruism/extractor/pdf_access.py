@@ -0,0 +1,54 @@
+import mmap
+from collections import OrderedDict
+
+PDF_PAGE_TEXT_CACHE_SIZE = 4
+
+
+# PdfFileReader only reads the xref table up front and resolves page objects on
+# demand, so reading it from a memory map keeps untouched pages out of memory
+class MappedPdf:
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.file = None
+        self.mapped_file = None
+        self.reader = None
+        self.page_text_cache = OrderedDict()
+
+    def __enter__(self):
+        from PyPDF2 import PdfFileReader
+
+        self.file = open(self.filepath, 'rb')
+        self.mapped_file = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.reader = PdfFileReader(self.mapped_file)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.reader = None
+        self.page_text_cache.clear()
+
+        if self.mapped_file is not None:
+            self.mapped_file.close()
+            self.mapped_file = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def get_number_of_pages(self):
+        return self.reader.getNumPages()
+
+    # neighbouring organizations often share a page, so keep the last few
+    def get_page_text(self, page_number):
+        if page_number in self.page_text_cache:
+            self.page_text_cache.move_to_end(page_number)
+            return self.page_text_cache[page_number]
+
+        page_text = self.reader.getPage(page_number).extractText()
+
+        self.page_text_cache[page_number] = page_text
+        if len(self.page_text_cache) > PDF_PAGE_TEXT_CACHE_SIZE:
+            self.page_text_cache.popitem(last=False)
+
+        return page_text
@@ -0,0 +1,202 @@
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+REQUEST_CONNECT_TIMEOUT_SECONDS = 10.0
+REQUEST_READ_TIMEOUT_SECONDS = 60.0
+REQUEST_MAX_RETRIES = 4
+REQUEST_BACKOFF_BASE_SECONDS = 0.5
+REQUEST_BACKOFF_MAX_SECONDS = 30.0
+REQUEST_MAX_REDIRECTS = 5
+
+CONNECTION_POOL_COUNT = 10
+CONNECTION_POOL_MAXSIZE = 8
+
+HOST_INITIAL_RATE = 2.0
+HOST_MIN_RATE = 0.2
+HOST_MAX_RATE = 20.0
+HOST_RATE_INCREASE = 0.5
+HOST_RATE_DECREASE_FACTOR = 0.5
+HOST_BURST = 4
+HOST_TARGET_LATENCY_SECONDS = 2.0
+
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_COOLDOWN_SECONDS = 60.0
+
+THROTTLE_STATUSES = {429, 503}
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst,
+                                  self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait_seconds = (1 - self.tokens) / self.rate
+
+            time.sleep(wait_seconds)
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.rate = rate
+
+
+class HostLimiter:
+    # additive increase while the host answers quickly, multiplicative decrease when it
+    # throttles or errors; slow answers only hold the rate, since large pages such as
+    # oneworld365's 999-row windows are slow because of their size, not a struggling host
+    def __init__(self, host):
+        self.host = host
+        self.bucket = TokenBucket(HOST_INITIAL_RATE, HOST_BURST)
+        self.latency_average = None
+        self.consecutive_failures = 0
+        self.circuit_open_until = 0.0
+        self.lock = threading.Lock()
+
+    def check_circuit(self):
+        with self.lock:
+            if time.monotonic() < self.circuit_open_until:
+                raise CircuitOpenError('Circuit open for host: ' + self.host)
+
+    def record_success(self, latency_seconds):
+        with self.lock:
+            self.consecutive_failures = 0
+            self.latency_average = latency_seconds if self.latency_average is None \
+                else 0.8 * self.latency_average + 0.2 * latency_seconds
+
+            if self.latency_average <= HOST_TARGET_LATENCY_SECONDS:
+                self.bucket.set_rate(min(HOST_MAX_RATE, self.bucket.rate + HOST_RATE_INCREASE))
+
+    def record_throttle(self):
+        with self.lock:
+            self.decrease_rate()
+
+    def record_failure(self):
+        with self.lock:
+            self.decrease_rate()
+            self.consecutive_failures += 1
+
+            if self.consecutive_failures >= CIRCUIT_FAILURE_THRESHOLD:
+                self.circuit_open_until = time.monotonic() + CIRCUIT_COOLDOWN_SECONDS
+                self.consecutive_failures = 0
+
+    def decrease_rate(self):
+        self.bucket.set_rate(max(HOST_MIN_RATE, self.bucket.rate * HOST_RATE_DECREASE_FACTOR))
+
+
+class RequestScheduler:
+    def __init__(self, num_pools=CONNECTION_POOL_COUNT, maxsize=CONNECTION_POOL_MAXSIZE,
+                 max_retries=REQUEST_MAX_RETRIES):
+        self.num_pools = num_pools
+        self.maxsize = maxsize
+        self.max_retries = max_retries
+        self.http = None
+        self.http_pid = None
+        self.host_limiters = {}
+        self.lock = threading.Lock()
+
+    # a spawned worker process gets the settings only and builds its own pool manager
+    # and host limiters
+    def __getstate__(self):
+        return {'num_pools': self.num_pools, 'maxsize': self.maxsize,
+                'max_retries': self.max_retries}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @staticmethod
+    def create_pool_manager(num_pools, maxsize):
+        import urllib3
+
+        return urllib3.PoolManager(
+            num_pools=num_pools,
+            maxsize=maxsize,
+            block=True,
+            timeout=urllib3.Timeout(connect=REQUEST_CONNECT_TIMEOUT_SECONDS,
+                                    read=REQUEST_READ_TIMEOUT_SECONDS),
+            retries=urllib3.Retry(total=None, connect=0, read=0, status=0,
+                                  redirect=REQUEST_MAX_REDIRECTS,
+                                  raise_on_status=False))
+
+    # created on first use, so extractors can be imported without urllib3; a forked
+    # worker process must not reuse the keep-alive sockets of its parent
+    def get_pool_manager(self):
+        if self.http is None or self.http_pid != os.getpid():
+            self.http = self.create_pool_manager(self.num_pools, self.maxsize)
+            self.http_pid = os.getpid()
+
+        return self.http
+
+    def request(self, method, url, **kwargs):
+        import urllib3
+
+        host_limiter = self.get_host_limiter(url)
+
+        response = None
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                time.sleep(self.get_backoff_seconds(attempt, response))
+
+            host_limiter.check_circuit()
+            host_limiter.bucket.acquire()
+
+            started_at = time.monotonic()
+            try:
+                response = self.get_pool_manager().request(method, url, **kwargs)
+            except urllib3.exceptions.HTTPError:
+                host_limiter.record_failure()
+                response = None
+
+                if attempt == self.max_retries:
+                    raise
+                continue
+
+            if response.status in THROTTLE_STATUSES:
+                host_limiter.record_throttle()
+            elif response.status in RETRYABLE_STATUSES:
+                host_limiter.record_failure()
+            else:
+                host_limiter.record_success(time.monotonic() - started_at)
+                return response
+
+        return response
+
+    def get_host_limiter(self, url):
+        host = urlsplit(url).netloc
+
+        with self.lock:
+            if host not in self.host_limiters:
+                self.host_limiters[host] = HostLimiter(host)
+
+            return self.host_limiters[host]
+
+    @staticmethod
+    def get_backoff_seconds(attempt, response):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after is not None and retry_after.isdigit():
+            return min(REQUEST_BACKOFF_MAX_SECONDS, float(retry_after))
+
+        backoff_ceiling = min(REQUEST_BACKOFF_MAX_SECONDS,
+                              REQUEST_BACKOFF_BASE_SECONDS * 2 ** attempt)
+        return random.uniform(0, backoff_ceiling)
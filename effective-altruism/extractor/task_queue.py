@@ -0,0 +1,280 @@
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+import traceback
+
+TASK_QUEUE_PATH = '../data/task_queue.sqlite3'
+TASK_MAX_ATTEMPTS = 3
+TASK_LEASE_SECONDS = 300.0
+TASK_QUEUE_BUSY_TIMEOUT_SECONDS = 30.0
+TASK_QUEUE_POLL_SECONDS = 1.0
+# the delays before a task's last attempt add up to more than the request scheduler's
+# circuit cooldown, so pages failing while a host's circuit is open are not all
+# dead-lettered within it
+TASK_RETRY_DELAY_SECONDS = 30.0
+
+TASK_STATUS_PENDING = 'pending'
+TASK_STATUS_LEASED = 'leased'
+TASK_STATUS_DONE = 'done'
+TASK_STATUS_DEAD = 'dead'
+
+TASK_QUEUE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tasks (
+    queue TEXT NOT NULL,
+    task_key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    leased_by TEXT,
+    lease_expires_at REAL,
+    result TEXT,
+    last_error TEXT,
+    not_before REAL,
+    PRIMARY KEY (queue, task_key)
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (queue, status);
+'''
+
+LEASABLE_CONDITION = \
+    '((status = ? AND (not_before IS NULL OR not_before <= ?)) ' \
+    'OR (status = ? AND lease_expires_at < ?))'
+
+
+# a task is leased to one worker at a time; a lease that is neither acked nor
+# failed before it expires (e.g. the worker crashed) makes the task available again
+class TaskQueue:
+    def __init__(self, queue, filepath=TASK_QUEUE_PATH,
+                 max_attempts=TASK_MAX_ATTEMPTS, lease_seconds=TASK_LEASE_SECONDS):
+        self.queue = queue
+        self.filepath = filepath
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.connection = None
+
+    def get_connection(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(
+                self.filepath, timeout=TASK_QUEUE_BUSY_TIMEOUT_SECONDS, isolation_level=None)
+            self.connection.execute('PRAGMA journal_mode = WAL')
+            self.connection.executescript(TASK_QUEUE_SCHEMA)
+            self.add_missing_columns(self.connection)
+
+        return self.connection
+
+    # queues created before failed tasks were delayed lack their retry time
+    @staticmethod
+    def add_missing_columns(connection):
+        columns = [column for _, column, *_ in connection.execute('PRAGMA table_info(tasks)')]
+        if 'not_before' not in columns:
+            connection.execute('ALTER TABLE tasks ADD COLUMN not_before REAL')
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    # tasks already in the queue keep their progress, so an interrupted run resumes;
+    # dead tasks get a fresh set of attempts
+    def enqueue(self, tasks):
+        connection = self.get_connection()
+
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(
+                'INSERT INTO tasks (queue, task_key, payload, status) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (queue, task_key) DO UPDATE SET '
+                'status = excluded.status, attempts = 0, last_error = NULL, not_before = NULL '
+                'WHERE tasks.status = ?',
+                ((self.queue, task_key, json.dumps(payload), TASK_STATUS_PENDING, TASK_STATUS_DEAD)
+                 for task_key, payload in tasks))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def lease(self, worker_id):
+        connection = self.get_connection()
+        now = time.time()
+
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'UPDATE tasks SET status = ?, last_error = ? '
+                'WHERE queue = ? AND status = ? AND lease_expires_at < ? AND attempts >= ?',
+                (TASK_STATUS_DEAD, 'Lease expired', self.queue, TASK_STATUS_LEASED, now,
+                 self.max_attempts))
+
+            task = connection.execute(
+                'SELECT task_key, payload FROM tasks WHERE queue = ? AND ' + LEASABLE_CONDITION
+                + ' ORDER BY rowid LIMIT 1',
+                (self.queue, TASK_STATUS_PENDING, now, TASK_STATUS_LEASED, now)).fetchone()
+
+            if task is not None:
+                connection.execute(
+                    'UPDATE tasks SET status = ?, attempts = attempts + 1, '
+                    'leased_by = ?, lease_expires_at = ? WHERE queue = ? AND task_key = ?',
+                    (TASK_STATUS_LEASED, worker_id, now + self.lease_seconds,
+                     self.queue, task[0]))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+        if task is None:
+            return None
+
+        task_key, payload = task
+        return task_key, json.loads(payload)
+
+    # a lease held by a process that no longer exists, from a crashed run or a worker
+    # that died, is released at once instead of when it expires
+    def reclaim_orphaned_leases(self):
+        connection = self.get_connection()
+        cursor = connection.execute(
+            'SELECT DISTINCT leased_by FROM tasks WHERE queue = ? AND status = ?',
+            (self.queue, TASK_STATUS_LEASED))
+        orphaned_workers = [worker_id for worker_id, in cursor.fetchall()
+                            if not is_worker_alive(worker_id)]
+
+        connection.executemany(
+            'UPDATE tasks SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, '
+            'last_error = ?, leased_by = NULL, lease_expires_at = NULL '
+            'WHERE queue = ? AND status = ? AND leased_by = ?',
+            ((self.max_attempts, TASK_STATUS_DEAD, TASK_STATUS_PENDING, 'Worker exited',
+              self.queue, TASK_STATUS_LEASED, worker_id) for worker_id in orphaned_workers))
+
+    def has_leasable_tasks(self):
+        now = time.time()
+        return self.get_connection().execute(
+            'SELECT 1 FROM tasks WHERE queue = ? AND ' + LEASABLE_CONDITION + ' LIMIT 1',
+            (self.queue, TASK_STATUS_PENDING, now, TASK_STATUS_LEASED, now)).fetchone() \
+            is not None
+
+    # pending and leased tasks; dead letters are counted apart
+    def get_unfinished_count(self):
+        return self.get_connection().execute(
+            'SELECT COUNT(*) FROM tasks WHERE queue = ? AND status IN (?, ?)',
+            (self.queue, TASK_STATUS_PENDING, TASK_STATUS_LEASED)).fetchone()[0]
+
+    def ack(self, task_key, result):
+        self.get_connection().execute(
+            'UPDATE tasks SET status = ?, result = ?, lease_expires_at = NULL '
+            'WHERE queue = ? AND task_key = ? AND status != ?',
+            (TASK_STATUS_DONE, json.dumps(result), self.queue, task_key, TASK_STATUS_DONE))
+
+    # a failed task waits longer after each attempt before it is leased again
+    def fail(self, task_key, error):
+        self.get_connection().execute(
+            'UPDATE tasks SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, '
+            'last_error = ?, lease_expires_at = NULL, not_before = ? + ? * attempts '
+            'WHERE queue = ? AND task_key = ? AND status = ?',
+            (self.max_attempts, TASK_STATUS_DEAD, TASK_STATUS_PENDING, error,
+             time.time(), TASK_RETRY_DELAY_SECONDS, self.queue, task_key, TASK_STATUS_LEASED))
+
+    def get_results(self):
+        cursor = self.get_connection().execute(
+            'SELECT task_key, result FROM tasks WHERE queue = ? AND status = ?',
+            (self.queue, TASK_STATUS_DONE))
+
+        return {task_key: json.loads(result) for task_key, result in cursor}
+
+    def get_dead_letters(self):
+        cursor = self.get_connection().execute(
+            'SELECT task_key, attempts, last_error FROM tasks WHERE queue = ? AND status = ?',
+            (self.queue, TASK_STATUS_DEAD))
+
+        return [{'task_key': task_key, 'attempts': attempts, 'last_error': last_error}
+                for task_key, attempts, last_error in cursor]
+
+    # dead letters of tasks a run no longer has, e.g. a page dropped from its listing,
+    # would otherwise be reported as failed by every later run
+    def purge_dead_letters(self, task_keys):
+        task_keys = set(task_keys)
+        dead_task_keys = [dead_letter['task_key'] for dead_letter in self.get_dead_letters()
+                          if dead_letter['task_key'] not in task_keys]
+
+        self.get_connection().executemany(
+            'DELETE FROM tasks WHERE queue = ? AND task_key = ? AND status = ?',
+            ((self.queue, task_key, TASK_STATUS_DEAD) for task_key in dead_task_keys))
+
+    def get_status_counts(self):
+        cursor = self.get_connection().execute(
+            'SELECT status, COUNT(*) FROM tasks WHERE queue = ? GROUP BY status', (self.queue,))
+
+        return dict(cursor.fetchall())
+
+    # dead letters are kept until the next run enqueues them again or no longer has them
+    def clear_done(self):
+        self.get_connection().execute(
+            'DELETE FROM tasks WHERE queue = ? AND status = ?', (self.queue, TASK_STATUS_DONE))
+
+    # returns once every task is done or dead; tasks still leased by a live process,
+    # e.g. a concurrent run, are waited for until they finish or their lease expires,
+    # and failed tasks until their retry delay has passed
+    def drain(self, handler, workers=1):
+        while True:
+            self.reclaim_orphaned_leases()
+            if not self.get_unfinished_count():
+                return
+
+            if self.has_leasable_tasks():
+                self.drain_with_workers(handler, workers)
+            else:
+                time.sleep(TASK_QUEUE_POLL_SECONDS)
+
+    def drain_with_workers(self, handler, workers):
+        if workers <= 1:
+            drain_task_queue(self, handler)
+            return
+
+        # each worker opens its own connection, none is shared with this process
+        processes = [multiprocessing.Process(
+            target=drain_task_queue_in_worker,
+            args=(self.queue, self.filepath, self.max_attempts, self.lease_seconds, handler))
+            for _ in range(workers)]
+
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+
+# workers are identified by their process id
+def is_worker_alive(worker_id):
+    try:
+        os.kill(int(worker_id), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        return True
+
+    return True
+
+
+def drain_task_queue(task_queue, handler):
+    worker_id = str(os.getpid())
+
+    while True:
+        task = task_queue.lease(worker_id)
+        if task is None:
+            return
+
+        task_key, payload = task
+        try:
+            result = handler(payload)
+        except Exception:
+            print('Warning: Task failed: ' + task_key)
+            task_queue.fail(task_key, traceback.format_exc())
+            continue
+
+        task_queue.ack(task_key, result)
+
+
+def drain_task_queue_in_worker(queue, filepath, max_attempts, lease_seconds, handler):
+    task_queue = TaskQueue(queue, filepath, max_attempts, lease_seconds)
+    try:
+        drain_task_queue(task_queue, handler)
+    finally:
+        task_queue.close()
@@ -0,0 +1,22 @@
+import re
+
+NON_ALPHANUMERIC_PATTERN = re.compile('[^a-zA-Z0-9 ]')
+
+
+# chained str.replace calls stay in C for any text, while str.translate
+# and re.sub walk it one character or match at a time
+def replace_line_breaks(text):
+    return text.replace('\r', ' ').replace('\n', ' ')
+
+
+def remove_line_breaks(text):
+    return text.replace('\r', '').replace('\n', '')
+
+
+def replace_control_whitespace(text):
+    return text.replace('\n', ' ').replace('\r', ' ').replace('\t', ' ')
+
+
+# field labels are short, where one precompiled pattern beats a translate table
+def remove_non_alphanumeric(text):
+    return NON_ALPHANUMERIC_PATTERN.sub('', text)
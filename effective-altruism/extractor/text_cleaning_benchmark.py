@@ -0,0 +1,56 @@
+import random
+import re
+import time
+
+from text_cleaning import remove_line_breaks, remove_non_alphanumeric, \
+    replace_control_whitespace, replace_line_breaks
+
+BENCHMARK_TEXT_COUNT = 200000
+
+# descriptions are long and may hold any text, field labels are short
+DESCRIPTION_WORDS = ['Organization', 'Mission:', 'children\'s', 'education', 'Myanmar', 'Café',
+                     'naïve', '–', '\r\n', '\n', '\t', 'www.example.org', '&', 'A/B']
+DESCRIPTION_LENGTHS = [4, 40, 200]
+LABEL_WORDS = ['Organization', 'Mission:', 'E-mail', 'Tel.', '(65)', 'Work Phone:', 'A/B',
+               'How will a grant make a difference?']
+LABEL_LENGTHS = [1, 2, 3]
+
+CLEANERS = [
+    ('replace line breaks', replace_line_breaks,
+     lambda text: re.sub("[\r\n]", " ", text), DESCRIPTION_WORDS, DESCRIPTION_LENGTHS),
+    ('remove line breaks', remove_line_breaks,
+     lambda text: re.sub("[\n\r]", "", text), DESCRIPTION_WORDS, DESCRIPTION_LENGTHS),
+    ('replace control whitespace', replace_control_whitespace,
+     lambda text: re.sub("[\n\r\t]", " ", text), DESCRIPTION_WORDS, DESCRIPTION_LENGTHS),
+    ('remove non alphanumeric', remove_non_alphanumeric,
+     lambda text: re.sub("[^a-zA-Z0-9 ]", "", text), LABEL_WORDS, LABEL_LENGTHS),
+]
+
+
+def generate_texts(count, words, lengths):
+    random.seed(0)
+
+    return [' '.join(random.choice(words) for _ in range(random.choice(lengths)))
+            for _ in range(count)]
+
+
+def measure(cleaner, texts):
+    started_at = time.perf_counter()
+    cleaned_texts = list(map(cleaner, texts))
+    return time.perf_counter() - started_at, cleaned_texts
+
+
+def main():
+    print('Texts per cleaner: ' + str(BENCHMARK_TEXT_COUNT))
+
+    for label, cleaner, regex_cleaner, words, lengths in CLEANERS:
+        texts = generate_texts(BENCHMARK_TEXT_COUNT, words, lengths)
+        regex_seconds, regex_texts = measure(regex_cleaner, texts)
+        cleaner_seconds, cleaned_texts = measure(cleaner, texts)
+
+        print('{:<28} re.sub: {:6.3f}s  shared: {:6.3f}s  speedup: {:5.1f}x  matches: {}'.format(
+            label, regex_seconds, cleaner_seconds, regex_seconds / cleaner_seconds,
+            regex_texts == cleaned_texts))
+
+
+main()
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import zipfile
+
+from charity_store import CharityStore
+from freshness_store import FreshnessStore
+from parse_cache import ParseCache
+from task_queue import TaskQueue
+
+TRAFFIC_ARCHIVE_RECORD = 'record'
+TRAFFIC_ARCHIVE_REPLAY = 'replay'
+
+
+class ArchivedHeaders(dict):
+    def get(self, key, default=None):
+        return super().get(key.lower(), default)
+
+
+class ArchivedResponse:
+    def __init__(self, status, headers, data):
+        self.status = status
+        self.headers = ArchivedHeaders((key.lower(), value) for key, value in headers.items())
+        self.data = data
+
+
+# responses are keyed by method, url, fields and body but not by headers, so a
+# replay answers the same requests whatever the conditional headers
+class TrafficArchive:
+    def __init__(self, filepath, mode):
+        self.filepath = filepath
+        self.mode = mode
+        self.zip_file = zipfile.ZipFile(
+            filepath, 'w' if mode == TRAFFIC_ARCHIVE_RECORD else 'r', zipfile.ZIP_DEFLATED)
+        self.recorded_names = set()
+        self.lock = threading.Lock()
+
+    def is_recording(self):
+        return self.mode == TRAFFIC_ARCHIVE_RECORD
+
+    def is_replaying(self):
+        return self.mode == TRAFFIC_ARCHIVE_REPLAY
+
+    def close(self):
+        self.zip_file.close()
+
+    @staticmethod
+    def generate_request_key(method, url, request_kwargs):
+        body = request_kwargs.get('body')
+        if isinstance(body, bytes):
+            body = body.decode('utf-8', 'replace')
+
+        request_json = json.dumps([method, url, request_kwargs.get('fields'), body],
+                                  sort_keys=True, default=str)
+        return hashlib.sha1(request_json.encode('utf-8')).hexdigest()
+
+    def record_response(self, method, url, request_kwargs, response):
+        request_key = self.generate_request_key(method, url, request_kwargs)
+        self.put_json('http/' + request_key + '.json', {
+            'method': method,
+            'url': url,
+            'status': response.status,
+            'headers': dict(response.headers),
+        })
+        self.put_bytes('http/' + request_key + '.body', response.data)
+
+    def replay_response(self, method, url, request_kwargs):
+        request_key = self.generate_request_key(method, url, request_kwargs)
+        try:
+            response = self.get_json('http/' + request_key + '.json')
+        except KeyError:
+            raise KeyError('Request not in traffic archive: ' + method + ' ' + url) from None
+
+        return ArchivedResponse(response['status'], response['headers'],
+                                self.zip_file.read('http/' + request_key + '.body'))
+
+    # a request made more than once keeps its first response
+    def put_bytes(self, name, data):
+        with self.lock:
+            if name not in self.recorded_names:
+                self.zip_file.writestr(name, data)
+                self.recorded_names.add(name)
+
+    def put_json(self, name, value):
+        self.put_bytes(name, json.dumps(value))
+
+    def get_json(self, name):
+        with self.lock:
+            return json.loads(self.zip_file.read(name))
+
+    def create_scheduler(self, scheduler):
+        if self.is_recording():
+            return RecordingScheduler(self, scheduler)
+
+        return ReplayScheduler(self)
+
+
+class RecordingScheduler:
+    def __init__(self, traffic_archive, scheduler):
+        self.traffic_archive = traffic_archive
+        self.scheduler = scheduler
+
+    def request(self, method, url, **kwargs):
+        response = self.scheduler.request(method, url, **kwargs)
+        self.traffic_archive.record_response(method, url, kwargs, response)
+        return response
+
+
+class ReplayScheduler:
+    def __init__(self, traffic_archive):
+        self.traffic_archive = traffic_archive
+
+    def request(self, method, url, **kwargs):
+        return self.traffic_archive.replay_response(method, url, kwargs)
+
+
+# freshness, caches, run history and queues start empty in a directory of their own, so a
+# recording holds every full response and a replay parses every page again; detail
+# pages are crawled in this process, where the archive is open. A replay also writes its
+# outputs there, so replaying an old archive leaves the current datasets alone
+def use_traffic_archive(extractor_class, traffic_archive, state_path):
+    shutil.rmtree(state_path, ignore_errors=True)
+    os.makedirs(state_path)
+
+    if hasattr(extractor_class, 'http'):
+        extractor_class.http = traffic_archive.create_scheduler(extractor_class.http)
+    if hasattr(extractor_class, 'freshness_store'):
+        extractor_class.freshness_store = FreshnessStore(
+            os.path.join(state_path, 'freshness.json'))
+    if hasattr(extractor_class, 'parse_cache'):
+        extractor_class.parse_cache = ParseCache(os.path.join(state_path, 'parse_cache.json'))
+    if hasattr(extractor_class, 'charity_store'):
+        extractor_class.charity_store = CharityStore(
+            os.path.join(state_path, 'charities.sqlite3'))
+    if hasattr(extractor_class, 'task_queue'):
+        extractor_class.task_queue = TaskQueue(
+            extractor_class.task_queue.queue, os.path.join(state_path, 'task_queue.sqlite3'))
+    if hasattr(extractor_class, 'detail_workers'):
+        extractor_class.detail_workers = 1
+    if hasattr(extractor_class, 'details_cache_path'):
+        extractor_class.details_cache_path = os.path.join(state_path, 'details')
+    if hasattr(extractor_class, 'traffic_archive'):
+        extractor_class.traffic_archive = traffic_archive
+
+    if traffic_archive.is_replaying():
+        extractor_class.json_dump_path = os.path.join(
+            state_path, os.path.basename(extractor_class.json_dump_path))
+        extractor_class.csv_dump_path = os.path.join(
+            state_path, os.path.basename(extractor_class.csv_dump_path))